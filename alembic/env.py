@@ -41,6 +41,7 @@ if config.config_file_name:
 # Make sure app.database.Base is importable (project root is current working directory)
 try:
     from app.database import Base  # noqa: E402
+    import app.models  # noqa: E402,F401  registers the tables on Base.metadata
 except Exception as exc:
     raise RuntimeError("Could not import Base from app.database. Ensure your project root is current working directory and app.database is importable.") from exc
 
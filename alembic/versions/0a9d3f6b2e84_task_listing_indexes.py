@@ -0,0 +1,30 @@
+"""task listing indexes found by the query plan check
+
+Revision ID: 0a9d3f6b2e84
+Revises: f4c1a8e2d639
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9d3f6b2e84'
+down_revision: Union[str, Sequence[str], None] = 'f4c1a8e2d639'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_tasks_created_at', 'tasks', ['created_at'])
+    op.create_index('idx_tasks_current_assignee', 'tasks', ['current_assignee_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_tasks_current_assignee', table_name='tasks')
+    op.drop_index('idx_tasks_created_at', table_name='tasks')
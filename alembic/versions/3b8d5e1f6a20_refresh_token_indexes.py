@@ -0,0 +1,32 @@
+"""refresh token indexes
+
+Revision ID: 3b8d5e1f6a20
+Revises: 7c1e2f9a4b3d
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8d5e1f6a20'
+down_revision: Union[str, Sequence[str], None] = '7c1e2f9a4b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_refresh_tokens_jti', 'refresh_tokens', ['jti'], unique=True)
+    op.create_index('idx_refresh_tokens_expires', 'refresh_tokens', ['expires_at'])
+    op.create_index('idx_refresh_tokens_revoked', 'refresh_tokens', ['id'], postgresql_where=sa.text('revoked'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_refresh_tokens_revoked', table_name='refresh_tokens')
+    op.drop_index('idx_refresh_tokens_expires', table_name='refresh_tokens')
+    op.drop_index('idx_refresh_tokens_jti', table_name='refresh_tokens')
@@ -9,6 +9,7 @@ from typing import Sequence, Union
 
 from alembic import op
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
 
 # revision identifiers, used by Alembic.
@@ -20,13 +21,154 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     """Upgrade schema."""
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.create_table('teams',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_teams_id'), 'teams', ['id'], unique=False)
+    op.create_table('users',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('username', sa.String(length=100), nullable=True),
+    sa.Column('email', sa.String(length=255), nullable=True),
+    sa.Column('team_id', sa.Integer(), nullable=True),
+    sa.Column('hashed_password', sa.Text(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), server_default=sa.text('true'), nullable=False),
+    sa.Column('is_superuser', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    sa.Column('last_login', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+    op.create_table('roles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('permissions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('role_permissions',
+    sa.Column('role_id', sa.Integer(), nullable=False),
+    sa.Column('permission_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['permission_id'], ['permissions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('role_id', 'permission_id')
+    )
+    op.create_table('user_roles',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('role_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'role_id')
+    )
+    op.create_table('refresh_tokens',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('jti', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('issued_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('revoked', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('tasks',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('title', sa.String(length=1000), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('status', postgresql.ENUM('unassigned', 'assigned', 'in_progress', 'review', 'completed', 'abandoned', name='task_status'), server_default='unassigned', nullable=False),
+    sa.Column('priority', sa.Integer(), server_default=sa.text('1'), nullable=False),
+    sa.Column('due_date', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_by', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('current_assignment_id', sa.BigInteger(), nullable=True),
+    sa.Column('deleted_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.CheckConstraint('priority BETWEEN 1 AND 5', name='priority_range_check'),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_tasks_duedate', 'tasks', ['due_date'], unique=False)
+    op.create_index('idx_tasks_priority', 'tasks', ['priority'], unique=False)
+    op.create_index('idx_tasks_status', 'tasks', ['status'], unique=False)
+    op.create_index(op.f('ix_tasks_id'), 'tasks', ['id'], unique=False)
+    op.create_table('assignment',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('task_id', sa.BigInteger(), nullable=False),
+    sa.Column('assigned_to', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('assigned_by', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('assigned_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('delegated', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['assigned_by'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['assigned_to'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_assignment_assigned_to', 'assignment', ['assigned_to'], unique=False)
+    op.create_index('idx_assignment_task', 'assignment', ['task_id'], unique=False)
+    op.create_index(op.f('ix_assignment_id'), 'assignment', ['id'], unique=False)
+    # tasks and assignment reference each other, so this key is added once both exist.
+    op.create_foreign_key(
+        'tasks_current_assignment_id_fkey', 'tasks', 'assignment',
+        ['current_assignment_id'], ['id'], ondelete='SET NULL'
+    )
+    op.create_table('task_dependencies',
+    sa.Column('task_id', sa.BigInteger(), nullable=False),
+    sa.Column('depends_on_task_id', sa.BigInteger(), nullable=False),
+    sa.CheckConstraint('task_id <> depends_on_task_id', name='no_self_dependency'),
+    sa.ForeignKeyConstraint(['depends_on_task_id'], ['tasks.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('task_id', 'depends_on_task_id')
+    )
+    op.create_table('task_comments',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('task_id', sa.BigInteger(), nullable=False),
+    sa.Column('author_id', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('edited_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_comments_task', 'task_comments', ['task_id'], unique=False)
+    op.create_index(op.f('ix_task_comments_id'), 'task_comments', ['id'], unique=False)
 
 
 def downgrade() -> None:
     """Downgrade schema."""
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.drop_constraint('tasks_current_assignment_id_fkey', 'tasks', type_='foreignkey')
+    op.drop_index('idx_comments_task', table_name='task_comments')
+    op.drop_index(op.f('ix_task_comments_id'), table_name='task_comments')
+    op.drop_table('task_comments')
+    op.drop_table('task_dependencies')
+    op.drop_index('idx_assignment_assigned_to', table_name='assignment')
+    op.drop_index('idx_assignment_task', table_name='assignment')
+    op.drop_index(op.f('ix_assignment_id'), table_name='assignment')
+    op.drop_table('assignment')
+    op.drop_index('idx_tasks_duedate', table_name='tasks')
+    op.drop_index('idx_tasks_priority', table_name='tasks')
+    op.drop_index('idx_tasks_status', table_name='tasks')
+    op.drop_index(op.f('ix_tasks_id'), table_name='tasks')
+    op.drop_table('tasks')
+    op.drop_table('refresh_tokens')
+    op.drop_table('user_roles')
+    op.drop_table('role_permissions')
+    op.drop_table('permissions')
+    op.drop_table('roles')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_teams_id'), table_name='teams')
+    op.drop_table('teams')
+    sa.Enum(name='task_status').drop(op.get_bind(), checkfirst=True)
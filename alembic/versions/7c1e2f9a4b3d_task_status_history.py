@@ -0,0 +1,79 @@
+"""task status history and flow rollups
+
+Revision ID: 7c1e2f9a4b3d
+Revises: 452f683dca88
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e2f9a4b3d'
+down_revision: Union[str, Sequence[str], None] = '452f683dca88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+task_status = postgresql.ENUM(name='task_status', create_type=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'task_status_transitions',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('task_id', sa.BigInteger(), nullable=False),
+        sa.Column('from_status', task_status, nullable=True),
+        sa.Column('to_status', task_status, nullable=False),
+        sa.Column('assignee_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('transitioned_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['assignee_id'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_status_transitions_task', 'task_status_transitions', ['task_id', 'transitioned_at'])
+
+    op.create_table(
+        'task_flow_daily',
+        sa.Column('scope', sa.String(length=10), nullable=False),
+        sa.Column('scope_id', sa.String(length=64), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('created_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('started_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('completed_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('lead_time_seconds', sa.Float(), server_default=sa.text('0'), nullable=False),
+        sa.Column('cycle_time_seconds', sa.Float(), server_default=sa.text('0'), nullable=False),
+        sa.Column('cycle_time_samples', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'scope_id', 'day'),
+    )
+
+    op.create_table(
+        'job_watermarks',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('last_id', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+    # Seed history for existing tasks so the first rollup sees their creation
+    # and, where it has moved on, their current status.
+    op.execute(
+        "INSERT INTO task_status_transitions (task_id, from_status, to_status, transitioned_at) "
+        "SELECT id, NULL, 'unassigned', created_at FROM tasks ORDER BY created_at"
+    )
+    op.execute(
+        "INSERT INTO task_status_transitions (task_id, from_status, to_status, transitioned_at) "
+        "SELECT id, 'unassigned', status, updated_at FROM tasks WHERE status <> 'unassigned' ORDER BY updated_at"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('job_watermarks')
+    op.drop_table('task_flow_daily')
+    op.drop_index('idx_status_transitions_task', table_name='task_status_transitions')
+    op.drop_table('task_status_transitions')
@@ -0,0 +1,31 @@
+"""idempotency key claim lease
+
+Revision ID: 8f3b6d2a4c71
+Revises: 5d2f8a1c7e93
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b6d2a4c71'
+down_revision: Union[str, Sequence[str], None] = '5d2f8a1c7e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'idempotency_keys',
+        sa.Column('locked_until', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('idempotency_keys', 'locked_until')
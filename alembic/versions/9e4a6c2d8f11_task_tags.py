@@ -0,0 +1,36 @@
+"""task tags
+
+Revision ID: 9e4a6c2d8f11
+Revises: 3b8d5e1f6a20
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4a6c2d8f11'
+down_revision: Union[str, Sequence[str], None] = '3b8d5e1f6a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'task_tags',
+        sa.Column('task_id', sa.BigInteger(), nullable=False),
+        sa.Column('tag', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('task_id', 'tag'),
+    )
+    op.create_index('idx_task_tags_tag', 'task_tags', ['tag', 'task_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_task_tags_tag', table_name='task_tags')
+    op.drop_table('task_tags')
@@ -0,0 +1,76 @@
+"""overdue sweeper state
+
+Revision ID: c5f0a7e3b912
+Revises: 9e4a6c2d8f11
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f0a7e3b912'
+down_revision: Union[str, Sequence[str], None] = '9e4a6c2d8f11'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'idx_tasks_open_duedate', 'tasks', ['due_date'],
+        postgresql_where=sa.text("status NOT IN ('completed', 'abandoned') AND due_date IS NOT NULL")
+    )
+    op.create_index('idx_tasks_updated_at', 'tasks', ['updated_at'])
+    op.add_column('job_watermarks', sa.Column('last_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+    op.create_table(
+        'overdue_tasks',
+        sa.Column('task_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('due_date', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('task_id'),
+    )
+    op.create_index('idx_overdue_tasks_user', 'overdue_tasks', ['user_id', 'due_date'])
+
+    op.create_table(
+        'user_overdue',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('overdue_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_index('idx_user_overdue_count', 'user_overdue', ['overdue_count'])
+
+    op.create_table(
+        'overdue_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('task_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('event', sa.String(length=20), nullable=False),
+        sa.Column('occurred_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_overdue_events_task', 'overdue_events', ['task_id', 'occurred_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_overdue_events_task', table_name='overdue_events')
+    op.drop_table('overdue_events')
+    op.drop_index('idx_user_overdue_count', table_name='user_overdue')
+    op.drop_table('user_overdue')
+    op.drop_index('idx_overdue_tasks_user', table_name='overdue_tasks')
+    op.drop_table('overdue_tasks')
+    op.drop_column('job_watermarks', 'last_at')
+    op.drop_index('idx_tasks_updated_at', table_name='tasks')
+    op.drop_index('idx_tasks_open_duedate', table_name='tasks')
@@ -0,0 +1,46 @@
+"""task open_blockers counter
+
+Revision ID: d2b8e6f1c047
+Revises: c5f0a7e3b912
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8e6f1c047'
+down_revision: Union[str, Sequence[str], None] = 'c5f0a7e3b912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tasks', sa.Column('open_blockers', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.execute(
+        """
+        UPDATE tasks SET open_blockers = b.n
+        FROM (
+            SELECT d.task_id, count(*) AS n
+            FROM task_dependencies d
+            JOIN tasks p ON p.id = d.depends_on_task_id
+            WHERE p.status NOT IN ('completed', 'abandoned')
+            GROUP BY d.task_id
+        ) b
+        WHERE tasks.id = b.task_id
+        """
+    )
+    op.create_index(
+        'idx_tasks_ready', 'tasks', ['open_blockers', sa.text('priority DESC'), 'created_at'],
+        postgresql_where=sa.text("status NOT IN ('completed', 'abandoned')")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_tasks_ready', table_name='tasks')
+    op.drop_column('tasks', 'open_blockers')
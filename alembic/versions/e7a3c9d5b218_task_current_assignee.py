@@ -0,0 +1,44 @@
+"""denormalized current assignee and inbox index
+
+Revision ID: e7a3c9d5b218
+Revises: d2b8e6f1c047
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3c9d5b218'
+down_revision: Union[str, Sequence[str], None] = 'd2b8e6f1c047'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tasks', sa.Column('current_assignee_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key(
+        'tasks_current_assignee_id_fkey', 'tasks', 'users',
+        ['current_assignee_id'], ['id'], ondelete='SET NULL'
+    )
+    op.execute(
+        "UPDATE tasks SET current_assignee_id = a.assigned_to "
+        "FROM assignment a WHERE a.id = tasks.current_assignment_id"
+    )
+    op.create_index(
+        'idx_tasks_assignee_inbox', 'tasks', ['current_assignee_id', sa.text('priority DESC'), 'due_date'],
+        postgresql_include=['id', 'title', 'status', 'open_blockers'],
+        postgresql_where=sa.text("status NOT IN ('completed', 'abandoned')")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_tasks_assignee_inbox', table_name='tasks')
+    op.drop_constraint('tasks_current_assignee_id_fkey', 'tasks', type_='foreignkey')
+    op.drop_column('tasks', 'current_assignee_id')
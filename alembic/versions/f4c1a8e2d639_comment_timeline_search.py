@@ -0,0 +1,37 @@
+"""comment timeline and search indexes
+
+Revision ID: f4c1a8e2d639
+Revises: e7a3c9d5b218
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1a8e2d639'
+down_revision: Union[str, Sequence[str], None] = 'e7a3c9d5b218'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_comments_task_created', 'task_comments', ['task_id', 'created_at', 'id'])
+    # The (task_id, created_at, id) index serves every lookup the task_id index did.
+    op.drop_index('idx_comments_task', table_name='task_comments')
+    op.create_index(
+        'idx_comments_body_fts', 'task_comments',
+        [sa.text("to_tsvector('english'::regconfig, body)")],
+        postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_comments_body_fts', table_name='task_comments')
+    op.create_index('idx_comments_task', 'task_comments', ['task_id'])
+    op.drop_index('idx_comments_task_created', table_name='task_comments')
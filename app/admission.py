@@ -0,0 +1,153 @@
+import asyncio
+import os
+from typing import Dict, Optional
+from starlette.responses import JSONResponse
+from app.database import engine_options
+
+ANALYTICS_PREFIXES = ("/task_distribution", "/overdue_by_user", "/analytics/", "/tasks/filter")
+# Pool connections kept back from requests for the background jobs and the idempotency
+# middleware's own sessions, neither of which goes through admission.
+POOL_RESERVE = int(os.getenv("ADMISSION_POOL_RESERVE", "5"))
+# Default share of the request budget per route class.
+CLASS_WEIGHTS = {"auth": 4, "writes": 6, "reads": 8, "analytics": 2}
+
+class Limiter:
+    """
+    Concurrency limit with a bounded FIFO wait queue. Requests that find the queue full,
+    or wait longer than max_wait seconds, are rejected instead of piling onto the DB pool.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @property
+    def sem(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the worker's running event loop.
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        return self._sem
+
+    async def acquire(self) -> bool:
+        if not self.sem.locked():
+            await self.sem.acquire()
+        elif self.queued >= self.max_queue:
+            self.rejected += 1
+            return False
+        else:
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self.sem.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.queued -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self.sem.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+def request_budget() -> Optional[int]:
+    """Pool connections left for admitted requests, or None when the pool is not bounded."""
+    if "pool_size" not in engine_options:
+        return None
+    return engine_options["pool_size"] + engine_options["max_overflow"] - POOL_RESERVE
+
+def _default_limits(budget: Optional[int]) -> Dict[str, int]:
+    if budget is None:
+        return dict(CLASS_WEIGHTS)
+    total = sum(CLASS_WEIGHTS.values())
+    return {name: max(1, budget * weight // total) for name, weight in CLASS_WEIGHTS.items()}
+
+def _limiter_from_env(name: str, limit: int, max_queue: int, max_wait: float) -> Limiter:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return Limiter(
+        name,
+        limit=int(os.getenv(prefix + "LIMIT", str(limit))),
+        max_queue=int(os.getenv(prefix + "QUEUE", str(max_queue))),
+        max_wait=float(os.getenv(prefix + "MAX_WAIT", str(max_wait))),
+    )
+
+class AdmissionController:
+    """Per-worker admission control, one limiter per route class."""
+
+    def __init__(self):
+        budget = request_budget()
+        limits = _default_limits(budget)
+        self.limiters = {
+            "auth": _limiter_from_env("auth", limit=limits["auth"], max_queue=50, max_wait=2.0),
+            "writes": _limiter_from_env("writes", limit=limits["writes"], max_queue=100, max_wait=2.0),
+            "reads": _limiter_from_env("reads", limit=limits["reads"], max_queue=200, max_wait=1.0),
+            "analytics": _limiter_from_env("analytics", limit=limits["analytics"], max_queue=10, max_wait=5.0),
+        }
+        total = sum(limiter.limit for limiter in self.limiters.values())
+        if budget is not None and total > budget:
+            raise RuntimeError(
+                f"admission limits add up to {total} connections but the pool leaves {budget} for requests "
+                "(DB_POOL_SIZE + DB_MAX_OVERFLOW - ADMISSION_POOL_RESERVE); lower the limits or grow the pool"
+            )
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        if path.startswith("/auth/"):
+            return "auth"
+        if path.startswith(ANALYTICS_PREFIXES):
+            return "analytics"
+        if path.startswith(("/docs", "/redoc", "/openapi.json", "/metrics")):
+            return None
+        if method in ("GET", "HEAD"):
+            return "reads"
+        return "writes"
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController, retry_after: int = 1):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.limiters[route_class]
+        if not await limiter.acquire():
+            response = JSONResponse(
+                {"detail": "Server busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+admission_controller = AdmissionController()
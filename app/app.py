@@ -1,23 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
-from app.database import get_db, engine, Base
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response, Header
+from app.database import get_db, engine, Base, APP_ENV, IS_SQLITE, check_schema_revision
 from sqlalchemy.ext.asyncio import AsyncSession
 import app.crud as crud
 import app.schemas as schemas
+import app.jobs as jobs
+from app.admission import AdmissionMiddleware, admission_controller
+from app.idempotency import IdempotencyMiddleware, idempotency_cache
+from app.encoding import encoded_response, encode_json, ndjson_chunks, NDJSONStreamingResponse
 from app.models import User, RefreshToken
-from app.auth_utils import hash_password, verify_password, create_access_token, create_refresh_token_jti, REFRESH_TOKEN_EXPIRE_DAYS
-from datetime import datetime, timedelta
+from app.auth_utils import hash_password, verify_password, create_access_token, create_refresh_token_jti, REFRESH_TOKEN_EXPIRE_DAYS, revoked_refresh_tokens
+from datetime import datetime, timedelta, date, timezone
+from uuid import UUID
 from sqlalchemy import select
 from app.deps import get_current_user
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.exc import IntegrityError
 from typing import Optional
+from pydantic import ValidationError
 
 app = FastAPI(title="Task Manager")
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+# Outermost, so replays of a finished request skip admission and the database.
+app.add_middleware(IdempotencyMiddleware, cache=idempotency_cache)
 
 @app.on_event("startup")
 async def on_startup():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        # Migrations target Postgres; embedded SQLite always builds its schema from the models.
+        if APP_ENV == "production" and not IS_SQLITE:
+            await check_schema_revision(conn)
+        else:
+            await conn.run_sync(Base.metadata.create_all)
+    app.state.jobs = jobs.start_jobs()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await jobs.stop_jobs(app.state.jobs)
+    await engine.dispose()
 
 @app.post("/auth/signup")
 async def signup(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
@@ -54,7 +73,7 @@ async def login_for_token(
     access_token = create_access_token(sub=str(user.id), data={"roles": []})
 
     jti = create_refresh_token_jti()
-    expires_at = datetime.utcnow() + timedelta(days=30)  
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     rt = RefreshToken(user_id=user.id, jti=jti, expires_at=expires_at)
     db.add(rt)
     try:
@@ -72,25 +91,61 @@ async def login_for_token(
     }
 
 @app.post("/auth/token/refresh")
-async def refresh_token(refresh_jti: str, db: AsyncSession=Depends(get_db)):
-    q = await db.execute(select(RefreshToken).where(RefreshToken.jti == refresh_jti))
-    rt = q.scalars().first()
-    if not rt or rt.revoked or rt.expires_at < datetime.utcnow():
+async def refresh_token(refresh_jti: UUID, db: AsyncSession=Depends(get_db)):
+    if refresh_jti in revoked_refresh_tokens:
+        raise HTTPException(status_code=401, detail="Invalid refresh")
+    new_jti = create_refresh_token_jti()
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    rt = await crud.rotate_refresh_token(db, jti=refresh_jti, new_jti=new_jti, expires_at=expires_at)
+    if not rt:
         raise HTTPException(status_code=401, detail="Invalid refresh")
+    revoked_refresh_tokens.add(refresh_jti, expires_at)
     access_token = create_access_token(sub=str(rt.user_id))
     return {
         "access_token": access_token,
-        "token_type": "bearer"
+        "token_type": "bearer",
+        "refresh_jti": str(new_jti),
+        "refresh_expires_at": expires_at.isoformat()
     }
 
+@app.post("/auth/token/revoke")
+async def revoke_token(refresh_jti: UUID, db: AsyncSession=Depends(get_db)):
+    if refresh_jti not in revoked_refresh_tokens:
+        expires_at = await crud.revoke_refresh_token(db, jti=refresh_jti)
+        if expires_at:
+            revoked_refresh_tokens.add(refresh_jti, expires_at)
+    return {"status": "ok"}
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    return admission_controller.stats()
+
+@app.get("/metrics/idempotency")
+async def idempotency_metrics():
+    return idempotency_cache.stats()
+
 @app.get("/user/", response_model=list[schemas.UserRead])
-async def list_users(skip: int=0, limit: int=50, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
+async def list_users(request: Request, skip: int=0, limit: int=50, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
     if current_user.is_superuser:
-        users = await crud.list_users(db, skip=skip, limit=limit)
-        return users
+        users = await crud.list_user_rows(db, skip=skip, limit=limit)
+        return encoded_response(request, users, model=list[schemas.UserRead])
     else:
         raise HTTPException(status_code=401, detail="User not authorized to perform this operation")
 
+@app.post("/admin/users/bulk", response_model=schemas.UserProvisionResponse)
+async def provision_users(
+    payload: schemas.UserProvisionRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=401, detail="User not authorized to perform this operation")
+    results = await crud.provision_users(
+        db, [u.model_dump() for u in payload.users], create_missing_teams=payload.create_missing_teams
+    )
+    created = sum(1 for r in results if r["ok"])
+    return schemas.UserProvisionResponse(created=created, failed=len(results) - created, results=results)
+
 @app.post("/teams/", response_model=schemas.TeamRead)
 async def create_team(name: schemas.TeamCreate, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
     if current_user.is_superuser:
@@ -104,17 +159,93 @@ async def create_task(task_in: schemas.TaskCreate, db: AsyncSession=Depends(get_
     task = await crud.create_task(db, task_in)
     return task
 
+@app.get("/me/tasks", response_model=list[schemas.InboxTask])
+async def my_tasks(
+    request: Request,
+    skip: int=0,
+    limit: int=50,
+    db: AsyncSession=Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    tasks = await crud.list_user_inbox(db, current_user.id, skip=skip, limit=limit)
+    return encoded_response(request, tasks, model=list[schemas.InboxTask])
+
+@app.get("/tasks/ready", response_model=list[schemas.TaskRead])
+async def list_ready_tasks(
+    request: Request,
+    skip: int=0,
+    limit: int=50,
+    db: AsyncSession=Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    tasks = await crud.list_ready_tasks(db, skip=skip, limit=limit)
+    return encoded_response(request, tasks, model=list[schemas.TaskRead])
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Task version from an If-Match header carrying the ETag we hand out ("<version>")."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a task ETag")
+
+def version_conflict_status(if_match: Optional[str]) -> int:
+    return status.HTTP_412_PRECONDITION_FAILED if if_match is not None else status.HTTP_409_CONFLICT
+
+async def task_read(db: AsyncSession, task) -> schemas.TaskRead:
+    """Single-task body with the same comment_count the listings carry."""
+    counts = await crud.get_comment_counts(db, [task.id])
+    return schemas.TaskRead.model_validate(task).model_copy(update={"comment_count": counts.get(task.id, 0)})
+
 @app.get("/tasks/{task_id}", response_model=schemas.TaskRead)
-async def read_task(task_id: int, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
+async def read_task(task_id: int, response: Response, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
     task = await crud.get_task(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not Found")
-    return task
+    response.headers["ETag"] = f'"{task.version}"'
+    return await task_read(db, task)
+
+@app.patch("/tasks/{task_id}", response_model=schemas.TaskRead)
+async def update_task(
+    task_id: int,
+    task_in: schemas.TaskUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    item = {"id": task_id, **task_in.model_dump()}
+    if item["expected_version"] is None:
+        item["expected_version"] = parse_if_match(if_match)
+    updated_tasks, not_found, results = await crud.bulk_update_tasks(db, [item])
+    if not_found:
+        raise HTTPException(status_code=404, detail="Task not Found")
+    if results[0].get("conflict"):
+        raise HTTPException(status_code=version_conflict_status(if_match), detail=results[0]["error"])
+    if not results[0]["ok"]:
+        raise HTTPException(status_code=400, detail=results[0]["error"])
+    task = updated_tasks[0] if updated_tasks else await crud.get_task(db, task_id)
+    response.headers["ETag"] = f'"{task.version}"'
+    return await task_read(db, task)
+
+def total_count_headers(total: Optional[int], mode: str) -> dict:
+    if total is None:
+        return {}
+    return {"X-Total-Count": str(total), "X-Total-Count-Mode": mode}
 
 @app.get("/tasks/", response_model=list[schemas.TaskRead])
-async def list_tasks(skip: int=0, limit: int=50, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
-    tasks = await crud.list_tasks(db, skip=skip, limit=limit)
-    return tasks
+async def list_tasks(
+    request: Request,
+    skip: int=0,
+    limit: int=50,
+    count: str = Query("none", regex="^(exact|estimate|none)$"),
+    db: AsyncSession=Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    tasks = await crud.list_task_rows(db, skip=skip, limit=limit)
+    headers = total_count_headers(*await crud.count_tasks(db, mode=count))
+    return encoded_response(request, tasks, headers=headers, model=list[schemas.TaskRead])
 
 @app.post("/tasks/bulk_update", response_model=schemas.BulkTaskUpdateResponse)
 async def bulk_update_tasks(
@@ -122,34 +253,111 @@ async def bulk_update_tasks(
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user),
 ):
-    items = [item.dict(exclude_unset=False) for item in payload.items]
+    items = [item.model_dump() for item in payload.items]
     updated_tasks, not_found, results = await crud.bulk_update_tasks(db, items)
 
     updated_ids = [t.id for t in updated_tasks] if updated_tasks else []
-    return schemas.BulkTaskUpdateResponse(updated=updated_ids, not_found=not_found, results=[schemas.BulkTaskUpdateResultItem(**r) for r in results])
+    conflicts = [r["id"] for r in results if r.get("conflict")]
+    return schemas.BulkTaskUpdateResponse(updated=updated_ids, not_found=not_found, conflicts=conflicts, results=[schemas.BulkTaskUpdateResultItem(**r) for r in results])
+
+BULK_UPDATE_STREAM_CHUNK_SIZE = 1000
+BULK_UPDATE_STREAM_MAX_LINE_BYTES = 64 * 1024
+
+def validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in e.errors()
+    )
+
+@app.post("/tasks/bulk_update/stream", response_class=NDJSONStreamingResponse)
+async def bulk_update_tasks_stream(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    """
+    NDJSON form of /tasks/bulk_update: one item per request line, one result per response line.
+    Lines are validated and applied BULK_UPDATE_STREAM_CHUNK_SIZE at a time, each chunk in its
+    own transaction, so memory stays flat however large the upload is. The last line holds totals.
+    """
+    async def results():
+        totals = {"updated": 0, "not_found": 0, "conflicts": 0, "failed": 0}
+        async for chunk in ndjson_chunks(request.stream(), BULK_UPDATE_STREAM_CHUNK_SIZE, BULK_UPDATE_STREAM_MAX_LINE_BYTES):
+            out = {}
+            items, item_lines = [], []
+            for line_no, raw in chunk:
+                if raw is None:
+                    error = f"line exceeds {BULK_UPDATE_STREAM_MAX_LINE_BYTES} bytes"
+                else:
+                    try:
+                        items.append(schemas.BulkTaskUpdateItem.model_validate_json(raw).model_dump())
+                        item_lines.append(line_no)
+                        continue
+                    except ValidationError as e:
+                        error = validation_message(e)
+                out[line_no] = {"line": line_no, "id": None, "ok": False, "error": error, "version": None, "conflict": False}
+                totals["failed"] += 1
+            if items:
+                _, not_found, chunk_results = await crud.bulk_update_tasks(db, items, refresh=False)
+                # Each chunk is committed; drop its objects so the session does not grow.
+                db.expunge_all()
+                rejected = 0
+                for line_no, r in zip(item_lines, chunk_results):
+                    out[line_no] = {"line": line_no, **schemas.BulkTaskUpdateResultItem(**r).model_dump()}
+                    if r["ok"]:
+                        totals["updated"] += 1
+                    elif r.get("conflict"):
+                        totals["conflicts"] += 1
+                    else:
+                        rejected += 1
+                totals["not_found"] += len(not_found)
+                totals["failed"] += rejected - len(not_found)
+            yield b"".join(encode_json(out[line_no]) + b"\n" for line_no, _ in chunk)
+        yield encode_json({"totals": totals}) + b"\n"
+
+    return NDJSONStreamingResponse(results())
+
+@app.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    payload: schemas.BatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    committed, results = await crud.run_batch(db, [o.model_dump() for o in payload.operations])
+    response = schemas.BatchResponse(committed=committed, results=results)
+    if not committed:
+        raise HTTPException(status_code=400, detail=response.model_dump(mode="json"))
+    return response
 
-@app.post("/tasks/filter")
+@app.post("/tasks/filter", response_model=list[schemas.TaskRead])
 async def filter_tasks_route(
     filters: schemas.TaskFilter,
+    request: Request,
+    count: str = Query("none", regex="^(exact|estimate|none)$"),
     db: AsyncSession = Depends(get_db)
 ):
-    tasks = await crud.filter_tasks(
-        db,
+    criteria = dict(
         status=filters.status,
         priority=filters.priority,
         assignee=filters.assignee,
         start_date=filters.start_date,
         end_date=filters.end_date,
         title_search=filters.title_search,
+        tags_any=filters.tags_any,
+        tags_all=filters.tags_all,
         logic=filters.logic,
-        skip=filters.skip,
-        limit=filters.limit
+        where=filters.where.model_dump(exclude_none=True) if filters.where else None
     )
-    return tasks
+    try:
+        tasks = await crud.filter_task_rows(db, **criteria, skip=filters.skip, limit=filters.limit)
+        headers = total_count_headers(*await crud.count_tasks(db, mode=count, where=crud.task_filter_tree(**criteria)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encoded_response(request, tasks, headers=headers, model=list[schemas.TaskRead])
 
 @app.get("/task_distribution", response_model=schemas.TaskDistributionResponse)
 async def task_distribution(
-    group_by: str = Query("status", regex="^(status|priority|team|assignee)$"),
+    group_by: str = Query("status", regex="^(status|priority|team|assignee|tag)$"),
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_db)
@@ -161,33 +369,73 @@ async def task_distribution(
     items = [schemas.DistributionItem(key=r[0], count=r[1]) for r in rows]
     return schemas.TaskDistributionResponse(group_by=group_by, items=items)
 
+@app.post("/task_distribution/cube", response_model=schemas.DistributionCubeResponse)
+async def task_distribution_cube(
+    req: schemas.DistributionCubeRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        cube = await crud.get_task_distribution_cube(
+            db,
+            dimensions=req.group_by,
+            mode=req.mode,
+            where=req.where.model_dump(exclude_none=True) if req.where else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return cube
+
 @app.get("/overdue_by_user", response_model=schemas.OverdueByUserResponse)
 async def overdue_by_user(
+    request: Request,
     as_of: Optional[datetime] = None,
     include_tasks: bool = Query(False),
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_db)
 ):
-    as_of = as_of or datetime.utcnow()
-    rows = await crud.get_overdue_tasks_per_user(db, as_of=as_of, include_tasks=include_tasks, skip=skip, limit=limit)
-    users = []
-    for r in rows:
-        brief_tasks = None
-        if include_tasks and r.get("overdue_tasks"):
-            brief_tasks = [schemas.TaskBrief(**t) for t in r["overdue_tasks"]]
-        users.append(schemas.OverdueUserItem(
-            user_id=r["user_id"],
-            username=r.get("username"),
-            overdue_count=r["overdue_count"],
-            overdue_tasks=brief_tasks
-        ))
-    return schemas.OverdueByUserResponse(as_of=as_of, users=users)
+    # Without an explicit as_of, serve the sweeper's precomputed state; it lags real time by
+    # at most the sweep interval. A custom as_of needs the live query.
+    swept_at = None
+    if as_of is None:
+        swept_at, rows = await crud.get_overdue_state_per_user(db, include_tasks=include_tasks, skip=skip, limit=limit)
+    if swept_at is not None:
+        as_of = swept_at
+    else:
+        as_of = as_of or datetime.utcnow()
+        rows = await crud.get_overdue_tasks_per_user(db, as_of=as_of, include_tasks=include_tasks, skip=skip, limit=limit)
+    return encoded_response(request, {"as_of": as_of, "users": rows}, model=schemas.OverdueByUserResponse)
 
+@app.get("/analytics/flow", response_model=schemas.FlowMetricsResponse)
+async def flow_metrics(
+    scope: str = Query("all", regex="^(all|team|user)$"),
+    scope_id: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = Query("week", regex="^(day|week)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    try:
+        rows = await crud.get_flow_metrics(db, scope=scope, scope_id=scope_id, start=start, end=end, bucket=bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = [schemas.FlowMetricsItem(**r) for r in rows]
+    return schemas.FlowMetricsResponse(scope=scope, bucket=bucket, items=items)
 
 @app.post("/assignments/", response_model=schemas.AssignmentRead)
-async def create_assignment(a: schemas.AssignmentCreate, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
-    assignment = await crud.create_assignment(db, a)
+async def create_assignment(
+    a: schemas.AssignmentCreate,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession=Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    if a.expected_version is None:
+        a.expected_version = parse_if_match(if_match)
+    try:
+        assignment = await crud.create_assignment(db, a)
+    except crud.VersionConflict as e:
+        raise HTTPException(status_code=version_conflict_status(if_match), detail=str(e))
     return assignment
 
 @app.post("/comments/", response_model=schemas.CommentRead)
@@ -195,6 +443,33 @@ async def add_comment(c: schemas.CommentCreate, db: AsyncSession=Depends(get_db)
     comment = await crud.add_comment(db, c)
     return comment
 
+@app.get("/tasks/{task_id}/comments", response_model=schemas.CommentPage)
+async def list_task_comments(
+    task_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", regex="^(asc|desc)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    try:
+        comments, next_cursor = await crud.list_task_comments(
+            db, task_id, limit=limit, cursor=cursor, newest_first=order == "desc"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return schemas.CommentPage(items=comments, next_cursor=next_cursor)
+
+@app.get("/comments/search", response_model=list[schemas.CommentRead])
+async def search_comments(
+    q: str = Query(..., min_length=1),
+    task_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    return await crud.search_comments(db, q, task_id=task_id, limit=limit)
+
 @app.post("/tasks/{task_id}/dependencies/{depends_on_id}")
 async def add_dependency(task_id: int, depends_on_id: int, db:AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
     if task_id == depends_on_id:
@@ -207,3 +482,8 @@ async def add_dependency(task_id: int, depends_on_id: int, db:AsyncSession=Depen
     dep = await crud.add_dependency(db, task_id=task_id, depends_on_task_id=depends_on_id)
     return {"status": "ok","dependency": {"task_id": dep.task_id, "depends_on_task_id": dep.depends_on_task_id}}
 
+@app.delete("/tasks/{task_id}/dependencies/{depends_on_id}")
+async def remove_dependency(task_id: int, depends_on_id: int, db: AsyncSession=Depends(get_db), current_user = Depends(get_current_user)):
+    if not await crud.remove_dependency(db, task_id=task_id, depends_on_task_id=depends_on_id):
+        raise HTTPException(status_code=404, detail="Dependency not found")
+    return {"status": "ok"}
@@ -1,9 +1,12 @@
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from jose import jwt
 import uuid
 import os
-from typing import Optional
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List
 
 pwd_ctx = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
 
@@ -16,6 +19,15 @@ def hash_password(password: str) -> str:
     """Hash a plaintext password (Argon2 preferred)."""
     return pwd_ctx.hash(password)
 
+# argon2 and bcrypt release the GIL while hashing, so threads hash in parallel.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 4)))
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords on the worker pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[loop.run_in_executor(_hash_pool, hash_password, p) for p in passwords])
+
 def verify_password(plain: str, hashed: str) -> bool:
     """Verify a plaintext password against a stored hash."""
     return pwd_ctx.verify(plain, hashed)
@@ -35,3 +47,37 @@ def create_access_token(*, sub: str, data: dict | None = None, expires_delta: Op
 
 def create_refresh_token_jti() -> uuid.UUID:
     return uuid.uuid4()
+
+class RevokedTokenCache:
+    """
+    Per-process set of revoked refresh-token jtis, so replays of a token this worker already
+    revoked are rejected without a DB round trip. The database stays the source of truth.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._entries: Dict[uuid.UUID, datetime] = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti: uuid.UUID, expires_at: datetime):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[jti] = expires_at
+
+    def __contains__(self, jti: uuid.UUID) -> bool:
+        expires_at = self._entries.get(jti)
+        return expires_at is not None and expires_at > datetime.now(timezone.utc)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self):
+        now = datetime.now(timezone.utc)
+        self._entries = {k: v for k, v in self._entries.items() if v > now}
+        # Still full: drop the oldest insertions, they are the first to expire anyway.
+        overflow = len(self._entries) - self.max_size + 1
+        for k in list(self._entries)[:max(overflow, 0)]:
+            del self._entries[k]
+
+revoked_refresh_tokens = RevokedTokenCache()
@@ -1,11 +1,70 @@
-from sqlalchemy import select, update, insert, and_, or_, func, not_, text, cast, String, literal
+from sqlalchemy import select, update, insert, delete, and_, or_, func, not_, text, cast, String, literal, literal_column, case, tuple_, null, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import Task, User, Assignment, TaskComment, TaskDependency, Team, Role, Permission, RolePermission, UserRole, RolePermission, RefreshToken
-from app.schemas import TaskCreate, AssignmentCreate, CommentCreate, RoleCreate, PermissionCreate, UserRoleCreate, RefreshTokenCreate, RolePermissionCreate
-from sqlalchemy.orm import selectinload
+from app.models import Task, User, Assignment, TaskComment, TaskDependency, Team, Role, Permission, RolePermission, UserRole, RolePermission, RefreshToken, TaskStatusTransition, TaskFlowDaily, JobWatermark, TaskTag, OverdueTask, UserOverdue, OverdueEvent, IdempotencyKey, FINISHED_TASK_STATUSES, OPEN_TASK_SQL, COMMENT_TS_CONFIG, comment_tsvector
+from app.db_types import UTCDateTime
+from app.explain import Explain
+from app.filters import compile_task_filter, compile_filter_clause, legacy_filter_tree
+from app.schemas import TaskCreate, TaskRead, AssignmentCreate, AssignmentRead, CommentCreate, CommentRead, DependencyCreate, BulkTaskUpdateItem, RoleCreate, PermissionCreate, UserRoleCreate, RefreshTokenCreate, RolePermissionCreate
+from sqlalchemy.orm import selectinload, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import List, Dict, Any, Tuple, Optional
-from datetime import datetime, timezone
+from itertools import combinations
+from uuid import UUID, uuid4
+from datetime import datetime, timezone, timedelta, date
+from app.auth_utils import hash_passwords
 from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+import re
+import base64
+
+TASK_COUNT_CACHE_TTL = timedelta(seconds=30)
+_task_count_cache: Dict[str, Tuple[int, datetime]] = {}
+
+OVERDUE_SWEEP_JOB = "overdue_sweep"
+OVERDUE_SWEEP_LAG = timedelta(seconds=60)
+
+FLOW_ROLLUP_JOB = "task_flow_daily"
+FLOW_ROLLUP_LAG = timedelta(seconds=60)
+
+def _record_transition(db: AsyncSession, task_id: int, from_status: Optional[str], to_status: str, assignee_id=None):
+    db.add(TaskStatusTransition(
+        task_id=task_id,
+        from_status=from_status,
+        to_status=to_status,
+        assignee_id=assignee_id
+    ))
+
+def _dialect(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+def _upsert(db: AsyncSession, model):
+    """INSERT supporting on_conflict_do_* for the session's backend."""
+    return sqlite_insert(model) if _dialect(db) == "sqlite" else pg_insert(model)
+
+async def _lock_watermark(db: AsyncSession, name: str) -> Optional[JobWatermark]:
+    """Lock a job's watermark row, or return None when another worker is running the job."""
+    await db.execute(
+        _upsert(db, JobWatermark).values(name=name, last_id=0).on_conflict_do_nothing()
+    )
+    q = await db.execute(
+        select(JobWatermark)
+        .where(JobWatermark.name == name)
+        .with_for_update(skip_locked=True)
+        .execution_options(populate_existing=True)
+    )
+    return q.scalars().one_or_none()
+
+class VersionConflict(ValueError):
+    """A write carried an expected task version that no longer matches the row."""
+
+async def _commit_or_flush(db: AsyncSession, commit: bool):
+    # commit=False lets callers such as run_batch group several writes into one transaction.
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
 
 async def create_team(db: AsyncSession, name: str) -> Team:
     team = Team(name=name)
@@ -21,20 +80,103 @@ async def create_user(db: AsyncSession, username: str, email: str, team_id:int =
     await db.refresh(user)
     return user
 
+PROVISION_CHUNK_SIZE = 1000
+
+async def _resolve_teams(db: AsyncSession, names: List[str], create_missing: bool) -> Dict[str, int]:
+    if not names:
+        return {}
+    q = await db.execute(select(Team.name, func.min(Team.id)).where(Team.name.in_(names)).group_by(Team.name))
+    teams = dict(q.all())
+    missing = [n for n in names if n not in teams]
+    if missing and create_missing:
+        q = await db.execute(insert(Team).values([{"name": n} for n in missing]).returning(Team.name, Team.id))
+        teams.update(q.all())
+    return teams
+
+async def provision_users(
+    db: AsyncSession,
+    users: List[Dict[str, Any]],
+    create_missing_teams: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Create many users in one transaction with a result per input row. Passwords are hashed on
+    the auth_utils worker pool before any database work, so no connection sits idle in a
+    transaction while they hash. Usernames and emails are then checked in one query, teams
+    are resolved by name, and rows are inserted in chunks of PROVISION_CHUNK_SIZE.
+    """
+    results = [{"index": i, "username": u["username"], "ok": False, "id": None, "team_id": None, "error": None} for i, u in enumerate(users)]
+
+    if db.in_transaction():
+        # Only the caller's reads (e.g. the auth lookup) are open here; end them so the
+        # connection goes back to the pool for the hashing.
+        await db.commit()
+    hashes = await hash_passwords([u["password"] for u in users])
+
+    usernames = {u["username"] for u in users}
+    emails = {u["email"] for u in users}
+    # Both sides are served by the unique indexes on users.username and users.email.
+    q = await db.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))
+    )
+    taken_usernames, taken_emails = set(), set()
+    for username, email in q.all():
+        taken_usernames.add(username)
+        taken_emails.add(email)
+
+    teams = await _resolve_teams(db, list(dict.fromkeys(u["team"] for u in users if u.get("team"))), create_missing_teams)
+
+    pending = []
+    for r, u in zip(results, users):
+        email = u["email"]
+        if u["username"] in taken_usernames:
+            r["error"] = "username already exists"
+        elif email in taken_emails:
+            r["error"] = "email already exists"
+        elif u.get("team") and u["team"] not in teams:
+            r["error"] = f"team '{u['team']}' not found"
+        else:
+            # Later rows repeating a username or email from this request are rejected too.
+            taken_usernames.add(u["username"])
+            taken_emails.add(email)
+            r["team_id"] = teams.get(u.get("team"))
+            pending.append((r, u))
+
+    rows = [
+        {"id": uuid4(), "username": u["username"], "email": u["email"], "team_id": r["team_id"], "hashed_password": hashes[r["index"]]}
+        for r, u in pending
+    ]
+    created = set()
+    for start in range(0, len(rows), PROVISION_CHUNK_SIZE):
+        chunk = rows[start:start + PROVISION_CHUNK_SIZE]
+        # A concurrent signup may have taken a name since the check; those rows are skipped, not fatal.
+        q = await db.execute(_upsert(db, User).values(chunk).on_conflict_do_nothing().returning(User.id))
+        created.update(q.scalars().all())
+    await db.commit()
+
+    for (r, _), row in zip(pending, rows):
+        if row["id"] in created:
+            r.update(ok=True, id=row["id"])
+        else:
+            r["error"] = "username or email already exists"
+    return results
+
 async def list_users(db: AsyncSession, skip: int=0, limit: int=50):
     q = await db.execute(select(User).offset(skip).limit(limit))
     return q.scalars().all()
 
-async def create_task(db: AsyncSession, task_in: TaskCreate) -> Task:
+async def create_task(db: AsyncSession, task_in: TaskCreate, commit: bool = True) -> Task:
     task = Task(
         title=task_in.title,
         description=task_in.description,
         priority=task_in.priority,
         due_date=task_in.due_date,
-        created_by=task_in.created_by
+        created_by=task_in.created_by,
+        tags=task_in.tags or []
     )
     db.add(task)
-    await db.commit()
+    await db.flush()
+    _record_transition(db, task.id, None, "unassigned")
+    await _commit_or_flush(db, commit)
     await db.refresh(task)
     return task
 
@@ -46,14 +188,116 @@ async def list_tasks(db: AsyncSession, skip: int=0, limit: int=50):
     q = await db.execute(select(Task).offset(skip).limit(limit))
     return q.scalars().all()
 
+TASK_READ_COLUMNS = ("id", "title", "description", "status", "priority", "due_date", "updated_at", "created_at", "created_by", "open_blockers", "version")
+TASK_COLUMNS = tuple(c.name for c in Task.__table__.columns)
+USER_READ_COLUMNS = ("id", "username", "email", "team_id", "is_active", "is_superuser", "last_login", "created_at")
+
+async def _task_list_rows(db: AsyncSession, columns: Tuple[str, ...], stmt, params=None) -> List[Dict[str, Any]]:
+    """Plain dicts straight from result tuples, with tags and comment counts fetched in one batched query each."""
+    rows = [dict(zip(columns, r)) for r in (await db.execute(stmt, params or {})).all()]
+    if rows:
+        ids = [r["id"] for r in rows]
+        q = await db.execute(select(TaskTag.task_id, TaskTag.tag).where(TaskTag.task_id.in_(ids)))
+        tags: Dict[int, List[str]] = {}
+        for task_id, tag in q.all():
+            tags.setdefault(task_id, []).append(tag)
+        counts = await get_comment_counts(db, ids)
+        for r in rows:
+            r["tags"] = tags.get(r["id"], [])
+            r["comment_count"] = counts.get(r["id"], 0)
+    return rows
+
+async def list_task_rows(db: AsyncSession, skip: int=0, limit: int=50) -> List[Dict[str, Any]]:
+    stmt = select(*[Task.__table__.c[c] for c in TASK_READ_COLUMNS]).offset(skip).limit(limit)
+    return await _task_list_rows(db, TASK_READ_COLUMNS, stmt)
+
+async def list_ready_tasks(db: AsyncSession, skip: int=0, limit: int=50) -> List[Dict[str, Any]]:
+    """Open tasks with no open prerequisites, highest priority first; one range scan of idx_tasks_ready."""
+    stmt = (
+        select(*[Task.__table__.c[c] for c in TASK_READ_COLUMNS])
+        .where(Task.open_blockers == 0, text(OPEN_TASK_SQL))
+        .order_by(Task.priority.desc(), Task.created_at)
+        .offset(skip)
+        .limit(limit)
+    )
+    return await _task_list_rows(db, TASK_READ_COLUMNS, stmt)
+
+INBOX_COLUMNS = ("id", "title", "status", "priority", "due_date", "open_blockers")
+
+async def list_user_inbox(db: AsyncSession, user_id: UUID, skip: int=0, limit: int=50) -> List[Dict[str, Any]]:
+    """Open tasks currently assigned to user_id; an index-only scan of idx_tasks_assignee_inbox."""
+    q = await db.execute(
+        select(*[Task.__table__.c[c] for c in INBOX_COLUMNS])
+        .where(Task.current_assignee_id == user_id, text(OPEN_TASK_SQL))
+        .order_by(Task.priority.desc(), Task.due_date)
+        .offset(skip)
+        .limit(limit)
+    )
+    return [dict(zip(INBOX_COLUMNS, r)) for r in q.all()]
+
+async def list_user_rows(db: AsyncSession, skip: int=0, limit: int=50) -> List[Dict[str, Any]]:
+    q = await db.execute(select(*[User.__table__.c[c] for c in USER_READ_COLUMNS]).offset(skip).limit(limit))
+    return [dict(zip(USER_READ_COLUMNS, r)) for r in q.all()]
+
+async def _cached_task_count(db: AsyncSession) -> int:
+    now = datetime.now(timezone.utc)
+    cached = _task_count_cache.get("tasks")
+    if cached and cached[1] > now:
+        return cached[0]
+    total = (await db.execute(select(func.count()).select_from(Task))).scalar()
+    _task_count_cache["tasks"] = (total, now + TASK_COUNT_CACHE_TTL)
+    return total
+
+async def count_tasks(
+    db: AsyncSession,
+    mode: str = "exact",
+    where: Optional[Dict[str, Any]] = None
+) -> Tuple[Optional[int], str]:
+    """
+    Total for a task listing, returned with the mode actually used.
+    exact: COUNT(*), always current;
+    estimate: planner row estimate for filtered queries, pg_class.reltuples otherwise,
+    falling back to a COUNT(*) cached for TASK_COUNT_CACHE_TTL where there are no
+    statistics (filtered queries on other backends answer exactly);
+    none: no count.
+    """
+    if mode == "none":
+        return (None, "none")
+    if mode not in ("exact", "estimate"):
+        raise ValueError("unsupported count mode")
+    postgres = _dialect(db) == "postgresql"
+
+    if where is None:
+        if mode == "exact":
+            return (int((await db.execute(select(func.count()).select_from(Task))).scalar()), "exact")
+        if postgres:
+            q = await db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'tasks'::regclass"))
+            estimate = q.scalar()
+            # reltuples is -1 until the table has been vacuumed or analyzed.
+            if estimate is not None and estimate >= 0:
+                return (int(estimate), "estimate")
+        return (await _cached_task_count(db), "estimate")
+
+    if not postgres:
+        mode = "exact"
+    stmt, params = compile_task_filter(where)
+    stmt = stmt.order_by(None).offset(None).limit(None)
+    if mode == "estimate":
+        plan = (await db.execute(Explain(stmt), params)).scalar()
+        return (int(plan[0]["Plan"]["Plan Rows"]), "estimate")
+    total = (await db.execute(select(func.count()).select_from(stmt.subquery()), params)).scalar()
+    return (int(total), "exact")
+
 async def bulk_update_tasks(
     db: AsyncSession,
-    items: List[Dict[str, Any]]
+    items: List[Dict[str, Any]],
+    commit: bool = True,
+    refresh: bool = True
 ) -> Tuple[List[Task], List[int], List[Dict[str, Any]]]:
 
     allowed_fields = {
         "title", "description", "status", "priority",
-        "due_date", "current_assignment_id", "deleted_at"
+        "due_date", "current_assignment_id", "deleted_at", "tags"
     }
 
     if not items:
@@ -61,7 +305,8 @@ async def bulk_update_tasks(
 
     ids = [int(it["id"]) for it in items]
 
-    q = await db.execute(select(Task).where(Task.id.in_(ids)))
+    # Versions are bumped by Core UPDATEs elsewhere (create_assignment), so identity-map copies can be stale.
+    q = await db.execute(select(Task).where(Task.id.in_(ids)).execution_options(populate_existing=True))
     tasks = q.scalars().all()
     task_map = {t.id: t for t in tasks}
 
@@ -70,10 +315,20 @@ async def bulk_update_tasks(
         for it in items
         if it.get("current_assignment_id") is not None
     }
-    existing_assignments = set()
+    assignment_ids_to_check |= {
+        task_map[int(it["id"])].current_assignment_id
+        for it in items
+        if it.get("status") is not None
+        and int(it["id"]) in task_map
+        and task_map[int(it["id"])].current_assignment_id is not None
+    }
+    assignees = {}
     if assignment_ids_to_check:
-        q2 = await db.execute(select(Assignment.id).where(Assignment.id.in_(list(assignment_ids_to_check))))
-        existing_assignments = {row[0] for row in q2.all()}
+        q2 = await db.execute(
+            select(Assignment.id, Assignment.assigned_to).where(Assignment.id.in_(list(assignment_ids_to_check)))
+        )
+        assignees = {row[0]: row[1] for row in q2.all()}
+    existing_assignments = set(assignees)
 
     try:
         allowed_statuses = set(task_status_enum.enums)  # type: ignore[attr-defined]
@@ -83,8 +338,13 @@ async def bulk_update_tasks(
     results: List[Dict[str, Any]] = []
     updated_ids: List[int] = []
     not_found: List[int] = []
+    finished: List[int] = []
+    reopened: List[int] = []
+    integrity_error: Optional[IntegrityError] = None
+    # Items from this index on never ran because the transaction was aborted under them.
+    unprocessed_from = len(items)
 
-    for it in items:
+    for index, it in enumerate(items):
         tid = int(it.get("id"))
         if tid not in task_map:
             not_found.append(tid)
@@ -115,25 +375,76 @@ async def bulk_update_tasks(
                 results.append({"id": tid, "ok": False, "error": f"current_assignment_id {ca} does not exist"})
                 continue
 
-        changed = False
-        for k, v in it.items():
-            if k == "id":
-                continue
-            if k not in allowed_fields:
-                continue
-            if v is None:
-                continue
-            setattr(task, k, v)
-            changed = True
+        expected = it.get("expected_version")
+        if expected is not None and int(expected) != task.version:
+            results.append({"id": tid, "ok": False, "error": f"version conflict: expected {expected}, current {task.version}", "version": task.version, "conflict": True})
+            continue
 
-        if changed:
-            task.updated_at = datetime.now(timezone.utc)
-            updated_ids.append(tid)
+        changes = {k: v for k, v in it.items() if k in allowed_fields and k != "tags" and v is not None}
+        if changes.get("current_assignment_id") is not None:
+            changes["current_assignee_id"] = assignees.get(changes["current_assignment_id"])
+        tags = it.get("tags")
+        if not changes and tags is None:
+            results.append({"id": tid, "ok": True, "error": None, "version": task.version})
+            continue
 
-        results.append({"id": tid, "ok": True, "error": None})
-    try:
-        await db.commit()
-    except IntegrityError as exc:
+        changes["updated_at"] = datetime.now(timezone.utc)
+        new_version = None
+        while task is not None:
+            old_status = task.status
+            try:
+                q = await db.execute(
+                    update(Task)
+                    .where(Task.id == tid, Task.version == (int(expected) if expected is not None else task.version))
+                    .values(**changes, version=Task.version + 1)
+                    .returning(Task.version)
+                    .execution_options(synchronize_session=False)
+                )
+            except IntegrityError as exc:
+                integrity_error = exc
+                break
+            new_version = q.scalar()
+            if new_version is not None or expected is not None:
+                break
+            # Written since it was read, but the client sent no version to guard with:
+            # re-read the row and apply the change on top of it.
+            q = await db.execute(select(Task).where(Task.id == tid).execution_options(populate_existing=True))
+            task = q.scalar_one_or_none()
+            if task is not None and task.current_assignment_id is not None:
+                assignees.setdefault(task.current_assignment_id, task.current_assignee_id)
+        if integrity_error is not None:
+            unprocessed_from = index
+            break
+        if task is None:
+            not_found.append(tid)
+            results.append({"id": tid, "ok": False, "error": "Task not found"})
+            continue
+        if new_version is None:
+            # Someone else wrote the row since the client read it; nothing was changed.
+            results.append({"id": tid, "ok": False, "error": "version conflict: task was modified concurrently", "conflict": True})
+            continue
+        for k, v in {**changes, "version": new_version}.items():
+            set_committed_value(task, k, v)
+        if tags is not None:
+            task.tags = tags
+        updated_ids.append(tid)
+
+        if task.status != old_status:
+            _record_transition(db, tid, old_status, task.status, assignees.get(task.current_assignment_id))
+            was_finished = old_status in FINISHED_TASK_STATUSES
+            if was_finished != (task.status in FINISHED_TASK_STATUSES):
+                (reopened if was_finished else finished).append(tid)
+
+        results.append({"id": tid, "ok": True, "error": None, "version": new_version})
+    if integrity_error is None:
+        try:
+            await _adjust_open_blockers(db, finished, finished=True)
+            await _adjust_open_blockers(db, reopened, finished=False)
+            await _commit_or_flush(db, commit)
+        except IntegrityError as exc:
+            integrity_error = exc
+    if integrity_error is not None:
+        exc = integrity_error
         await db.rollback()
         db_msg = str(exc.orig) if hasattr(exc, "orig") else str(exc)
         new_results = []
@@ -142,17 +453,30 @@ async def bulk_update_tasks(
                 new_results.append(r)
             else:
                 new_results.append({"id": r["id"], "ok": False, "error": f"DB integrity error: {db_msg}"})
+        # One result per item: the failing item and everything after it get the same error.
+        for it in items[unprocessed_from:]:
+            new_results.append({"id": int(it["id"]), "ok": False, "error": f"DB integrity error: {db_msg}"})
         return ([], not_found, new_results)
 
+    updated_ids = list(dict.fromkeys(updated_ids))
+
     updated_tasks = []
     for tid in updated_ids:
         t = task_map.get(tid)
         if t:
-            await db.refresh(t)
+            if refresh:
+                await db.refresh(t)
             updated_tasks.append(t)
 
     return (updated_tasks, not_found, results)
 
+def task_filter_tree(where: Optional[Dict[str, Any]] = None, **criteria) -> Optional[Dict[str, Any]]:
+    """The single filter tree filter_tasks runs: flat criteria ANDed with `where`."""
+    tree = legacy_filter_tree(**criteria)
+    if where and tree:
+        return {"op": "and", "args": [tree, where]}
+    return where or tree
+
 async def filter_tasks(
     db: AsyncSession,
     *,
@@ -162,52 +486,45 @@ async def filter_tasks(
     start_date: Optional[str] = None,      
     end_date: Optional[str] = None,
     title_search: Optional[str] = None, 
+    tags_any: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
     logic: str = "AND",                    
+    where: Optional[Dict[str, Any]] = None,
     skip: int = 0,
     limit: int = 50
 ):
-    filters = []
-
-    if status:
-        filters.append(Task.status.in_(status))
-
-    if priority:
-        filters.append(Task.priority.in_(priority))
-
-    if assignee:
-        filters.append(Task.current_assignment_id.isnot(None))
-        filters.append(
-            Assignment.assigned_to.in_(assignee)
-        )
-
-    if start_date:
-        filters.append(Task.created_at >= start_date)
-
-    if end_date:
-        filters.append(Task.created_at <= end_date)
-
-    if title_search:
-        like = f"%{title_search.lower()}%"
-        filters.append(Task.title.ilike(like))
-
-    if logic.upper() == "OR":
-        combined = or_(*filters) if filters else None
-    else:
-        combined = and_(*filters) if filters else None
-
-    stmt = (
-        select(Task)
-        .outerjoin(Assignment, Assignment.id == Task.current_assignment_id)
+    """
+    Flat criteria are combined with `logic`; a nested `where` tree (see app.filters) is
+    ANDed with them. Raises ValueError for malformed trees.
+    """
+    tree = task_filter_tree(
+        status=status,
+        priority=priority,
+        assignee=assignee,
+        start_date=start_date,
+        end_date=end_date,
+        title_search=title_search,
+        tags_any=tags_any,
+        tags_all=tags_all,
+        logic=logic,
+        where=where
     )
-
-    if combined is not None:
-        stmt = stmt.where(combined)
-
-    stmt = stmt.order_by(Task.created_at.desc()).offset(skip).limit(limit)
-
-    result = await db.execute(stmt)
+    stmt, params = compile_task_filter(tree)
+    result = await db.execute(stmt, {**params, "skip": skip, "limit": limit})
     return result.scalars().all()
 
+async def filter_task_rows(
+    db: AsyncSession,
+    *,
+    skip: int = 0,
+    limit: int = 50,
+    **criteria
+) -> List[Dict[str, Any]]:
+    """filter_tasks returning plain dicts of every task column plus tags instead of ORM objects."""
+    stmt, params = compile_task_filter(task_filter_tree(**criteria))
+    stmt = stmt.with_only_columns(*Task.__table__.columns)
+    return await _task_list_rows(db, TASK_COLUMNS, stmt, {**params, "skip": skip, "limit": limit})
+
 async def get_task_distribution(
     db: AsyncSession,
     group_by: str = "status",
@@ -243,6 +560,13 @@ async def get_task_distribution(
             .order_by(func.count(Task.id).desc())
         )
 
+    elif group_by == "tag":
+        stmt = (
+            select(TaskTag.tag.label("key"), func.count(TaskTag.task_id))
+            .group_by(TaskTag.tag)
+            .order_by(func.count(TaskTag.task_id).desc())
+        )
+
     elif group_by == "assignee":
         stmt = (
             select(User.username.label("key"), func.count(Task.id))
@@ -261,6 +585,102 @@ async def get_task_distribution(
     rows = res.all()
     return [(str(r[0]) if r[0] is not None else None, int(r[1])) for r in rows]
 
+CUBE_DIMENSIONS = ("status", "priority", "team", "assignee")
+
+async def get_task_distribution_cube(
+    db: AsyncSession,
+    dimensions: List[str],
+    mode: str = "sets",
+    where: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Count tasks for several group_by dimensions in one scan.
+    mode="sets" returns each dimension on its own plus the total (GROUPING SETS);
+    mode="cube" also returns every combination of the dimensions (CUBE).
+    """
+    dimensions = list(dict.fromkeys(d.lower() for d in dimensions))
+    if not dimensions:
+        raise ValueError("at least one dimension is required")
+    unsupported = [d for d in dimensions if d not in CUBE_DIMENSIONS]
+    if unsupported:
+        raise ValueError(f"unsupported dimension(s): {', '.join(unsupported)}")
+    if mode not in ("sets", "cube"):
+        raise ValueError("unsupported mode value")
+
+    creator = aliased(User)
+    assignee = aliased(User)
+    columns = {
+        "status": cast(Task.status, String),
+        "priority": cast(Task.priority, String),
+        "team": Team.name,
+        "assignee": assignee.username,
+    }
+    keys = [columns[d] for d in dimensions]
+    n = len(dimensions)
+    clause, params = compile_filter_clause(where)
+
+    def grouped_select(*cols):
+        stmt = select(*cols).select_from(Task)
+        if "team" in dimensions:
+            stmt = (
+                stmt.outerjoin(creator, creator.id == Task.created_by)
+                .outerjoin(Team, Team.id == creator.team_id)
+            )
+        stmt = stmt.outerjoin(Assignment, Assignment.id == Task.current_assignment_id)
+        if "assignee" in dimensions:
+            stmt = stmt.outerjoin(assignee, assignee.id == Assignment.assigned_to)
+        if clause is not None:
+            stmt = stmt.where(clause)
+        return stmt
+
+    if _dialect(db) == "postgresql":
+        stmt = grouped_select(*keys, func.count(Task.id), func.grouping(*keys))
+        if mode == "cube":
+            stmt = stmt.group_by(func.cube(*keys))
+        else:
+            stmt = stmt.group_by(func.grouping_sets(*[tuple_(k) for k in keys], tuple_()))
+    else:
+        # No GROUPING SETS: emulate it with one UNION ALL statement, tagging each
+        # branch with the mask GROUPING() would have produced.
+        if mode == "cube":
+            sets = [c for size in range(n + 1) for c in combinations(range(n), size)]
+        else:
+            sets = [(i,) for i in range(n)] + [()]
+        branches = []
+        for grouped in sets:
+            mask = sum(1 << (n - 1 - i) for i in range(n) if i not in grouped)
+            cols = [keys[i] if i in grouped else null() for i in range(n)]
+            branches.append(
+                grouped_select(*cols, func.count(Task.id), literal(mask))
+                .group_by(*[keys[i] for i in grouped])
+            )
+        stmt = union_all(*branches)
+
+    res = await db.execute(stmt, params)
+
+    # GROUPING() sets bit (n-1-i) when dimension i is rolled up in that row.
+    groupings: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    total = 0
+    for r in res.all():
+        mask = r[n + 1]
+        grouped = tuple(d for i, d in enumerate(dimensions) if not mask & (1 << (n - 1 - i)))
+        count = int(r[n])
+        if not grouped:
+            total = count
+            continue
+        groupings.setdefault(grouped, []).append({
+            "keys": {d: (str(r[i]) if r[i] is not None else None) for i, d in enumerate(dimensions) if d in grouped},
+            "count": count
+        })
+
+    return {
+        "total": total,
+        "groupings": [
+            {"dimensions": list(dims), "items": sorted(items, key=lambda it: -it["count"])}
+            for dims, items in sorted(groupings.items(), key=lambda kv: (len(kv[0]), [dimensions.index(d) for d in kv[0]]))
+        ]
+    }
+
 async def get_overdue_tasks_per_user(
     db: AsyncSession,
     as_of: Optional[datetime] = None,
@@ -287,8 +707,7 @@ async def get_overdue_tasks_per_user(
             func.count(Task.id).label("overdue_count")
         )
         .select_from(Task)
-        .join(Assignment, Assignment.id == Task.current_assignment_id)
-        .join(User, User.id == Assignment.assigned_to)
+        .join(User, User.id == Task.current_assignee_id)
         .where(
             and_(
                 Task.due_date.isnot(None),
@@ -318,23 +737,22 @@ async def get_overdue_tasks_per_user(
                 Task.priority,
                 Task.status,
                 Task.created_by,
-                Assignment.assigned_to
+                Task.current_assignee_id
             )
-            .join(Assignment, Assignment.id == Task.current_assignment_id)
             .where(
                 and_(
-                    Assignment.assigned_to.in_(user_ids),
+                    Task.current_assignee_id.in_(user_ids),
                     Task.due_date.isnot(None),
                     Task.due_date < as_of,
                     Task.status.notin_(finished_statuses)
                 )
             )
-            .order_by(Assignment.assigned_to, Task.due_date.asc())
+            .order_by(Task.current_assignee_id, Task.due_date.asc())
         )
 
         res = await db.execute(q)
         for r in res.all():
-            uid = r.assigned_to
+            uid = r.current_assignee_id
             tasks_map.setdefault(uid, []).append({
                 "id": r.id,
                 "title": r.title,
@@ -355,7 +773,154 @@ async def get_overdue_tasks_per_user(
 
     return results
 
-async def create_assignment(db: AsyncSession, a: AssignmentCreate, set_current=True):
+async def sweep_overdue(db: AsyncSession) -> int:
+    """
+    Bring overdue_tasks/user_overdue up to date with tasks that crossed their due date, or
+    were edited, since the last sweep, recording an overdue_events row per change.
+    Returns the number of changes. The sweep trails the clock by OVERDUE_SWEEP_LAG so edits
+    from transactions still in flight are not skipped past.
+    """
+    watermark = await _lock_watermark(db, OVERDUE_SWEEP_JOB)
+    if watermark is None:
+        return 0
+    last_at = watermark.last_at
+    as_of = (await db.execute(select(func.now(type_=UTCDateTime())))).scalar() - OVERDUE_SWEEP_LAG
+
+    # Crossings are read from idx_tasks_open_duedate, edits from idx_tasks_updated_at.
+    crossed = and_(
+        text(OPEN_TASK_SQL),
+        Task.due_date.isnot(None),
+        Task.due_date <= as_of
+    )
+    if last_at is not None:
+        crossed = and_(crossed, Task.due_date > last_at)
+        candidates = or_(crossed, Task.updated_at > last_at)
+    else:
+        candidates = crossed
+
+    q = await db.execute(
+        select(Task.id, Task.status, Task.due_date, Assignment.assigned_to)
+        .outerjoin(Assignment, Assignment.id == Task.current_assignment_id)
+        .where(candidates)
+    )
+    rows = q.all()
+
+    current = {}
+    if rows:
+        q = await db.execute(
+            select(OverdueTask.task_id, OverdueTask.user_id)
+            .where(OverdueTask.task_id.in_([r.id for r in rows]))
+        )
+        current = {r.task_id: r.user_id for r in q.all()}
+
+    deltas: Dict[Any, int] = {}
+    events = []
+    resolved = []
+    added = []
+    for r in rows:
+        overdue = (
+            r.assigned_to is not None
+            and r.due_date is not None
+            and r.due_date <= as_of
+            and r.status not in FINISHED_TASK_STATUSES
+        )
+        previous = current.get(r.id)
+        wanted = r.assigned_to if overdue else None
+        if previous == wanted:
+            continue
+        if previous is not None:
+            resolved.append(r.id)
+            deltas[previous] = deltas.get(previous, 0) - 1
+            events.append({"task_id": r.id, "user_id": previous, "event": "resolved"})
+        if wanted is not None:
+            added.append({"task_id": r.id, "user_id": wanted, "due_date": r.due_date})
+            deltas[wanted] = deltas.get(wanted, 0) + 1
+            events.append({"task_id": r.id, "user_id": wanted, "event": "overdue"})
+
+    # Reassigned tasks appear in both lists, so deletes must run before inserts.
+    if resolved:
+        await db.execute(delete(OverdueTask).where(OverdueTask.task_id.in_(resolved)))
+    if added:
+        await db.execute(insert(OverdueTask), added)
+    if events:
+        await db.execute(insert(OverdueEvent), events)
+    deltas = {uid: d for uid, d in deltas.items() if d}
+    if deltas:
+        ins = _upsert(db, UserOverdue).values([
+            {"user_id": uid, "overdue_count": d} for uid, d in deltas.items()
+        ])
+        await db.execute(ins.on_conflict_do_update(
+            index_elements=[UserOverdue.user_id],
+            set_={
+                "overdue_count": UserOverdue.overdue_count + ins.excluded.overdue_count,
+                "updated_at": func.now()
+            }
+        ))
+
+    watermark.last_at = as_of
+    await db.commit()
+    return len(events)
+
+async def get_overdue_state_per_user(
+    db: AsyncSession,
+    include_tasks: bool = False,
+    skip: int = 0,
+    limit: int = 100
+) -> Tuple[Optional[datetime], List[Dict[str, Any]]]:
+    """
+    Overdue counts as of the last sweep, read from user_overdue/overdue_tasks.
+    Returns (as_of, rows) with rows shaped like get_overdue_tasks_per_user.
+    """
+    q = await db.execute(select(JobWatermark.last_at).where(JobWatermark.name == OVERDUE_SWEEP_JOB))
+    as_of = q.scalar()
+
+    q = await db.execute(
+        select(UserOverdue.user_id, User.username, UserOverdue.overdue_count)
+        .join(User, User.id == UserOverdue.user_id)
+        .where(UserOverdue.overdue_count > 0)
+        .order_by(UserOverdue.overdue_count.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    rows = q.all()
+
+    tasks_map = {}
+    if include_tasks and rows:
+        q = await db.execute(
+            select(
+                OverdueTask.user_id,
+                Task.id,
+                Task.title,
+                Task.due_date,
+                Task.priority,
+                Task.status,
+                Task.created_by
+            )
+            .join(Task, Task.id == OverdueTask.task_id)
+            .where(OverdueTask.user_id.in_([r.user_id for r in rows]))
+            .order_by(OverdueTask.user_id, OverdueTask.due_date.asc())
+        )
+        for r in q.all():
+            tasks_map.setdefault(r.user_id, []).append({
+                "id": r.id,
+                "title": r.title,
+                "due_date": r.due_date,
+                "priority": r.priority,
+                "status": r.status,
+                "created_by": r.created_by
+            })
+
+    return as_of, [
+        {
+            "user_id": r.user_id,
+            "username": r.username,
+            "overdue_count": int(r.overdue_count),
+            "overdue_tasks": tasks_map.get(r.user_id) if include_tasks else None
+        }
+        for r in rows
+    ]
+
+async def create_assignment(db: AsyncSession, a: AssignmentCreate, set_current=True, commit: bool = True):
     assignment = Assignment(
         task_id=a.task_id,
         assigned_to=a.assigned_to,
@@ -364,22 +929,542 @@ async def create_assignment(db: AsyncSession, a: AssignmentCreate, set_current=T
     db.add(assignment)
     await db.flush()
     if set_current:
-        await db.execute(
-            update(Task).where(Task.id==a.task_id).values(current_assignment_id=assignment.id)
+        stmt = update(Task).where(Task.id==a.task_id)
+        if a.expected_version is not None:
+            stmt = stmt.where(Task.version == a.expected_version)
+        q = await db.execute(
+            stmt.values(
+                current_assignment_id=assignment.id,
+                current_assignee_id=a.assigned_to,
+                updated_at=func.now(),
+                version=Task.version + 1
+            )
+            .returning(Task.id)
+            .execution_options(synchronize_session=False)
         )
-    await db.commit()
+        if q.scalar() is None and a.expected_version is not None:
+            raise VersionConflict(f"version conflict: task {a.task_id} is no longer at version {a.expected_version}")
+    await _commit_or_flush(db, commit)
     await db.refresh(assignment)
     return assignment
 
-async def add_comment(db: AsyncSession, c: CommentCreate):
+def encode_comment_cursor(created_at: datetime, comment_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{comment_id}".encode()).decode()
+
+def decode_comment_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, comment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+
+async def list_task_comments(
+    db: AsyncSession,
+    task_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    newest_first: bool = False
+) -> Tuple[List[TaskComment], Optional[str]]:
+    """
+    One page of a task's comment timeline, keyset-paginated on (created_at, id) so every page
+    is a range scan of idx_comments_task_created. Returns the page and the cursor of the next one.
+    """
+    key = tuple_(TaskComment.created_at, TaskComment.id)
+    stmt = select(TaskComment).where(TaskComment.task_id == task_id)
+    if cursor:
+        created_at, comment_id = decode_comment_cursor(cursor)
+        # Typed so the timestamp is bound in the column's storage format on every backend.
+        after = tuple_(literal(created_at, TaskComment.created_at.type), literal(comment_id, TaskComment.id.type))
+        stmt = stmt.where(key < after if newest_first else key > after)
+    if newest_first:
+        stmt = stmt.order_by(TaskComment.created_at.desc(), TaskComment.id.desc())
+    else:
+        stmt = stmt.order_by(TaskComment.created_at, TaskComment.id)
+    q = await db.execute(stmt.limit(limit + 1))
+    comments = q.scalars().all()
+    if len(comments) <= limit:
+        return (comments, None)
+    last = comments[limit - 1]
+    return (comments[:limit], encode_comment_cursor(last.created_at, last.id))
+
+async def search_comments(
+    db: AsyncSession,
+    query: str,
+    task_id: Optional[int] = None,
+    limit: int = 50
+) -> List[TaskComment]:
+    """Full-text comment search ranked by relevance, served by the idx_comments_body_fts GIN index."""
+    stmt = select(TaskComment)
+    if _dialect(db) == "postgresql":
+        document = comment_tsvector(TaskComment.body)
+        tsquery = func.websearch_to_tsquery(COMMENT_TS_CONFIG, query)
+        stmt = stmt.where(document.op("@@")(tsquery)).order_by(func.ts_rank(document, tsquery).desc(), TaskComment.id.desc())
+    else:
+        # No text search outside Postgres: every word must appear in the body.
+        words = query.split()
+        if not words:
+            return []
+        stmt = stmt.where(*[TaskComment.body.ilike(f"%{w}%") for w in words]).order_by(TaskComment.id.desc())
+    if task_id is not None:
+        stmt = stmt.where(TaskComment.task_id == task_id)
+    q = await db.execute(stmt.limit(limit))
+    return q.scalars().all()
+
+async def get_comment_counts(db: AsyncSession, task_ids: List[int]) -> Dict[int, int]:
+    """Comment count per task for a whole page of tasks in one grouped index-only scan."""
+    if not task_ids:
+        return {}
+    q = await db.execute(
+        select(TaskComment.task_id, func.count())
+        .where(TaskComment.task_id.in_(task_ids))
+        .group_by(TaskComment.task_id)
+    )
+    return {task_id: n for task_id, n in q.all()}
+
+async def add_comment(db: AsyncSession, c: CommentCreate, commit: bool = True):
     comment = TaskComment(task_id=c.task_id, author_id=c.author_id, body=c.body)
     db.add(comment)
-    await db.commit()
+    await _commit_or_flush(db, commit)
     await db.refresh(comment)
     return comment
 
-async def add_dependency(db: AsyncSession, task_id: int, depends_on_task_id: int):
+async def _adjust_open_blockers(db: AsyncSession, prerequisite_ids: List[int], finished: bool):
+    """Decrement (finished) or increment (reopened) open_blockers of every dependent of these tasks."""
+    if not prerequisite_ids:
+        return
+    per_task = (
+        select(func.count())
+        .where(
+            TaskDependency.task_id == Task.id,
+            TaskDependency.depends_on_task_id.in_(prerequisite_ids)
+        )
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(Task)
+        .where(Task.id.in_(
+            select(TaskDependency.task_id).where(TaskDependency.depends_on_task_id.in_(prerequisite_ids))
+        ))
+        .values(open_blockers=Task.open_blockers - per_task if finished else Task.open_blockers + per_task)
+        .execution_options(synchronize_session=False)
+    )
+
+async def _prerequisite_is_open(db: AsyncSession, depends_on_task_id: int) -> bool:
+    # Row lock so a concurrent status change of the prerequisite is counted exactly once.
+    q = await db.execute(select(Task.status).where(Task.id == depends_on_task_id).with_for_update())
+    status = q.scalar()
+    return status is not None and status not in FINISHED_TASK_STATUSES
+
+async def add_dependency(db: AsyncSession, task_id: int, depends_on_task_id: int, commit: bool = True):
+    is_open = await _prerequisite_is_open(db, depends_on_task_id)
     dep = TaskDependency(task_id=task_id, depends_on_task_id=depends_on_task_id)
     db.add(dep)
-    await db.commit()
+    await db.flush()
+    if is_open:
+        await db.execute(update(Task).where(Task.id == task_id).values(open_blockers=Task.open_blockers + 1))
+    await _commit_or_flush(db, commit)
     return dep
+
+async def remove_dependency(db: AsyncSession, task_id: int, depends_on_task_id: int) -> bool:
+    is_open = await _prerequisite_is_open(db, depends_on_task_id)
+    q = await db.execute(
+        delete(TaskDependency).where(
+            TaskDependency.task_id == task_id,
+            TaskDependency.depends_on_task_id == depends_on_task_id
+        )
+    )
+    if not q.rowcount:
+        await db.rollback()
+        return False
+    if is_open:
+        await db.execute(update(Task).where(Task.id == task_id).values(open_blockers=Task.open_blockers - 1))
+    await db.commit()
+    return True
+
+BATCH_REF_FIELDS = {"id", "task_id", "depends_on_task_id", "current_assignment_id", "assigned_to", "assigned_by", "author_id", "created_by"}
+_BATCH_REF = re.compile(r"^\$([A-Za-z_][\w-]*)(?:\.(\w+))?$")
+
+def _resolve_refs(args: Dict[str, Any], refs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Replace "$ref" / "$ref.field" in id fields with values from earlier batch results."""
+    resolved = dict(args)
+    for key, value in args.items():
+        if key not in BATCH_REF_FIELDS or not isinstance(value, str):
+            continue
+        m = _BATCH_REF.match(value)
+        if not m:
+            continue
+        name, field = m.group(1), m.group(2) or "id"
+        if name not in refs:
+            raise ValueError(f"unknown reference '{value}'")
+        if field not in refs[name]:
+            raise ValueError(f"reference '{value}' has no field '{field}'")
+        resolved[key] = refs[name][field]
+    return resolved
+
+async def _run_batch_operation(db: AsyncSession, op: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    if op == "create_task":
+        task = await create_task(db, TaskCreate(**args), commit=False)
+        return TaskRead.model_validate(task).model_dump(mode="json")
+    if op == "update_task":
+        item = BulkTaskUpdateItem(**args).model_dump()
+        updated, not_found, results = await bulk_update_tasks(db, [item], commit=False)
+        if not results[0]["ok"]:
+            raise ValueError(results[0]["error"])
+        task = updated[0] if updated else await get_task(db, item["id"])
+        return TaskRead.model_validate(task).model_dump(mode="json")
+    if op == "assign":
+        assignment = await create_assignment(db, AssignmentCreate(**args), commit=False)
+        return AssignmentRead.model_validate(assignment).model_dump(mode="json")
+    if op == "add_comment":
+        comment = await add_comment(db, CommentCreate(**args), commit=False)
+        return CommentRead.model_validate(comment).model_dump(mode="json")
+    if op == "add_dependency":
+        dep = DependencyCreate(**args)
+        if dep.task_id == dep.depends_on_task_id:
+            raise ValueError("Task can not depend on itself")
+        q = await db.execute(select(func.count()).select_from(Task).where(Task.id.in_([dep.task_id, dep.depends_on_task_id])))
+        if q.scalar() != 2:
+            raise ValueError("Task not found")
+        await add_dependency(db, dep.task_id, dep.depends_on_task_id, commit=False)
+        return dep.model_dump(mode="json")
+    raise ValueError(f"unsupported operation '{op}'")
+
+async def run_batch(db: AsyncSession, operations: List[Dict[str, Any]]) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Run batch operations in order in one transaction. Ids created by earlier operations are
+    available to later ones through their `ref`. The first failure rolls everything back.
+    """
+    refs: Dict[str, Dict[str, Any]] = {}
+    results: List[Dict[str, Any]] = []
+    failed = False
+    for index, operation in enumerate(operations):
+        op, ref = operation["op"], operation.get("ref")
+        if failed:
+            results.append({"index": index, "op": op, "ref": ref, "ok": False, "error": "skipped"})
+            continue
+        try:
+            result = await _run_batch_operation(db, op, _resolve_refs(operation.get("args") or {}, refs))
+        except (ValueError, ValidationError) as e:
+            error = str(e)
+        except IntegrityError as e:
+            error = f"DB integrity error: {e.orig if hasattr(e, 'orig') else e}"
+        else:
+            if ref:
+                refs[ref] = result
+            results.append({"index": index, "op": op, "ref": ref, "ok": True, "result": result})
+            continue
+        failed = True
+        await db.rollback()
+        results.append({"index": index, "op": op, "ref": ref, "ok": False, "error": error})
+    if failed:
+        for r in results:
+            if r["ok"]:
+                r.update(ok=False, result=None, error="rolled back")
+        return (False, results)
+    await db.commit()
+    return (True, results)
+
+
+async def rotate_refresh_token(
+    db: AsyncSession,
+    jti: UUID,
+    new_jti: UUID,
+    expires_at: datetime
+) -> Optional[RefreshToken]:
+    """
+    Revoke a live refresh token and issue its replacement in one transaction.
+    The conditional UPDATE makes each token single-use even under concurrent refreshes.
+    """
+    res = await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == jti,
+            RefreshToken.revoked.is_(False),
+            RefreshToken.expires_at > func.now()
+        )
+        .values(revoked=True)
+        .returning(RefreshToken.user_id)
+    )
+    user_id = res.scalar()
+    if user_id is None:
+        await db.rollback()
+        return None
+    rt = RefreshToken(user_id=user_id, jti=new_jti, expires_at=expires_at)
+    db.add(rt)
+    await db.commit()
+    return rt
+
+async def revoke_refresh_token(db: AsyncSession, jti: UUID) -> Optional[datetime]:
+    res = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.jti == jti, RefreshToken.revoked.is_(False))
+        .values(revoked=True)
+        .returning(RefreshToken.expires_at)
+    )
+    expires_at = res.scalar()
+    await db.commit()
+    return expires_at
+
+async def purge_refresh_tokens(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Delete up to batch_size expired or revoked refresh tokens; returns the number deleted.
+    Each batch commits on its own so the purge never holds many row locks at once, and
+    rows another worker is already deleting are skipped rather than waited on.
+    """
+    doomed = (
+        select(RefreshToken.id)
+        .where(or_(RefreshToken.expires_at < func.now(), RefreshToken.revoked.is_(True)))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    res = await db.execute(delete(RefreshToken).where(RefreshToken.id.in_(doomed)))
+    await db.commit()
+    return res.rowcount
+
+async def claim_idempotency_key(
+    db: AsyncSession,
+    user_id: UUID,
+    key: str,
+    request_hash: str,
+    ttl: timedelta,
+    lease: timedelta
+) -> Tuple[Optional[int], Optional[IdempotencyKey]]:
+    """
+    Reserve (user_id, key) for a request that is about to run. Returns (claim id, None) when
+    the caller now owns the key, otherwise (None, existing row). The owner keeps the claim by
+    renewing its lease; expired rows and claims whose lease ran out (the worker died) are
+    taken over.
+    """
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            or_(
+                IdempotencyKey.expires_at <= now,
+                and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.locked_until < now),
+            ),
+        )
+    )
+    q = await db.execute(
+        _upsert(db, IdempotencyKey)
+        .values(
+            user_id=user_id, key=key, request_hash=request_hash,
+            created_at=now, locked_until=now + lease, expires_at=now + ttl
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "key"])
+        .returning(IdempotencyKey.id)
+    )
+    claim_id = q.scalar()
+    await db.commit()
+    if claim_id is not None:
+        return (claim_id, None)
+    q = await db.execute(
+        select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    )
+    return (None, q.scalars().first())
+
+async def renew_idempotency_claim(db: AsyncSession, claim_id: int, lease: timedelta) -> bool:
+    """Push an unfinished claim's lease forward; False once the claim is gone or finished."""
+    res = await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == claim_id, IdempotencyKey.status_code.is_(None))
+        .values(locked_until=datetime.now(timezone.utc) + lease)
+    )
+    await db.commit()
+    return res.rowcount == 1
+
+async def complete_idempotency_key(
+    db: AsyncSession,
+    claim_id: int,
+    status_code: int,
+    headers: str,
+    body: bytes
+) -> bool:
+    res = await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == claim_id, IdempotencyKey.status_code.is_(None))
+        .values(status_code=status_code, response_headers=headers, response_body=body)
+    )
+    await db.commit()
+    return res.rowcount == 1
+
+async def release_idempotency_key(db: AsyncSession, claim_id: int):
+    """Drop an unfinished claim so a retry with the same key runs the request again."""
+    await db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.id == claim_id, IdempotencyKey.status_code.is_(None))
+    )
+    await db.commit()
+
+async def purge_idempotency_keys(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Delete up to batch_size expired idempotency keys; returns the number deleted."""
+    doomed = (
+        select(IdempotencyKey.id)
+        .where(IdempotencyKey.expires_at < func.now())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    res = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(doomed)))
+    await db.commit()
+    return res.rowcount
+
+async def rollup_task_flow(db: AsyncSession, batch_size: int = 5000) -> int:
+    """
+    Fold status transitions recorded since the last run into task_flow_daily.
+    Returns the number of transitions consumed; callers loop until it drops below batch_size.
+    """
+    watermark = await _lock_watermark(db, FLOW_ROLLUP_JOB)
+    if watermark is None:
+        return 0
+
+    started = (
+        select(func.min(TaskStatusTransition.transitioned_at))
+        .where(
+            TaskStatusTransition.task_id == Task.id,
+            TaskStatusTransition.to_status == "in_progress"
+        )
+        .correlate(Task)
+        .scalar_subquery()
+    )
+    transition = TaskStatusTransition.__table__.alias("tr")
+    stmt = (
+        select(
+            transition.c.id,
+            transition.c.from_status,
+            transition.c.to_status,
+            transition.c.assignee_id,
+            transition.c.transitioned_at,
+            Task.created_at,
+            case((transition.c.to_status == "completed", started), else_=None).label("started_at"),
+            User.team_id
+        )
+        .select_from(transition)
+        .join(Task, Task.id == transition.c.task_id)
+        .outerjoin(User, User.id == transition.c.assignee_id)
+        .where(transition.c.id > watermark.last_id)
+        .order_by(transition.c.id)
+        .limit(batch_size)
+    )
+    rows = (await db.execute(stmt)).all()
+
+    # Stop at the first transition that is too recent: rows from transactions still in flight
+    # may commit with lower ids, and the watermark must never move past them.
+    cutoff = datetime.now(timezone.utc) - FLOW_ROLLUP_LAG
+    consumed = []
+    for r in rows:
+        if r.transitioned_at >= cutoff:
+            break
+        consumed.append(r)
+
+    if not consumed:
+        await db.rollback()
+        return 0
+
+    buckets: Dict[Tuple[str, str, date], Dict[str, float]] = {}
+    for r in consumed:
+        day = r.transitioned_at.astimezone(timezone.utc).date()
+        scopes = (
+            ("all", ""),
+            ("team", str(r.team_id) if r.team_id is not None else ""),
+            ("user", str(r.assignee_id) if r.assignee_id is not None else ""),
+        )
+        for scope, scope_id in scopes:
+            b = buckets.setdefault((scope, scope_id, day), {
+                "created_count": 0, "started_count": 0, "completed_count": 0,
+                "lead_time_seconds": 0.0, "cycle_time_seconds": 0.0, "cycle_time_samples": 0
+            })
+            if r.from_status is None:
+                b["created_count"] += 1
+            if r.to_status == "in_progress":
+                b["started_count"] += 1
+            if r.to_status == "completed":
+                b["completed_count"] += 1
+                b["lead_time_seconds"] += (r.transitioned_at - r.created_at).total_seconds()
+                if r.started_at is not None:
+                    b["cycle_time_seconds"] += (r.transitioned_at - r.started_at).total_seconds()
+                    b["cycle_time_samples"] += 1
+
+    values = [
+        {"scope": scope, "scope_id": scope_id, "day": day, **metrics}
+        for (scope, scope_id, day), metrics in buckets.items()
+    ]
+    ins = _upsert(db, TaskFlowDaily).values(values)
+    await db.execute(
+        ins.on_conflict_do_update(
+            index_elements=[TaskFlowDaily.scope, TaskFlowDaily.scope_id, TaskFlowDaily.day],
+            set_={
+                col: getattr(TaskFlowDaily, col) + getattr(ins.excluded, col)
+                for col in (
+                    "created_count", "started_count", "completed_count",
+                    "lead_time_seconds", "cycle_time_seconds", "cycle_time_samples"
+                )
+            }
+        )
+    )
+    watermark.last_id = consumed[-1].id
+    await db.commit()
+    return len(consumed)
+
+async def get_flow_metrics(
+    db: AsyncSession,
+    scope: str = "all",
+    scope_id: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = "week"
+) -> List[Dict[str, Any]]:
+    if bucket == "week" and _dialect(db) == "sqlite":
+        # Monday of the day's week, matching date_trunc('week', ...) on Postgres.
+        period = func.date(TaskFlowDaily.day, "-6 days", "weekday 1").label("period_start")
+    elif bucket == "week":
+        period = func.date_trunc("week", TaskFlowDaily.day).label("period_start")
+    elif bucket == "day":
+        period = TaskFlowDaily.day.label("period_start")
+    else:
+        raise ValueError("unsupported bucket value")
+
+    stmt = (
+        select(
+            TaskFlowDaily.scope_id,
+            period,
+            func.sum(TaskFlowDaily.created_count).label("created"),
+            func.sum(TaskFlowDaily.started_count).label("started"),
+            func.sum(TaskFlowDaily.completed_count).label("completed"),
+            func.sum(TaskFlowDaily.lead_time_seconds).label("lead_time_seconds"),
+            func.sum(TaskFlowDaily.cycle_time_seconds).label("cycle_time_seconds"),
+            func.sum(TaskFlowDaily.cycle_time_samples).label("cycle_time_samples")
+        )
+        .where(TaskFlowDaily.scope == scope)
+        .group_by(TaskFlowDaily.scope_id, period)
+        .order_by(TaskFlowDaily.scope_id, period)
+    )
+    if scope_id is not None:
+        stmt = stmt.where(TaskFlowDaily.scope_id == scope_id)
+    if start:
+        stmt = stmt.where(TaskFlowDaily.day >= start)
+    if end:
+        stmt = stmt.where(TaskFlowDaily.day <= end)
+
+    res = await db.execute(stmt)
+    items = []
+    for r in res.all():
+        completed = int(r.completed)
+        samples = int(r.cycle_time_samples)
+        period_start = r.period_start
+        if isinstance(period_start, datetime):
+            period_start = period_start.date()
+        elif isinstance(period_start, str):
+            period_start = date.fromisoformat(period_start)
+        items.append({
+            "scope_id": r.scope_id or None,
+            "period_start": period_start,
+            "created": int(r.created),
+            "started": int(r.started),
+            "completed": completed,
+            "avg_lead_time_seconds": float(r.lead_time_seconds) / completed if completed else None,
+            "avg_cycle_time_seconds": float(r.cycle_time_seconds) / samples if samples else None
+        })
+    return items
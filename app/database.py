@@ -1,13 +1,49 @@
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import text, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncConnection
 from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+APP_ENV = os.getenv("APP_ENV", "development")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+# Embedded mode (sqlite+aiosqlite:///path.db) for single-node deployments, CI and benchmarks.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+
+if IS_SQLITE:
+    engine_options = {}
+    if ":memory:" not in DATABASE_URL and "mode=memory" not in DATABASE_URL:
+        engine_options["pool_size"] = int(os.getenv("DB_POOL_SIZE", "5"))
+        engine_options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+else:
+    engine_options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": APP_ENV == "production",
+    }
+
+engine = create_async_engine(DATABASE_URL, echo=False, future=True, **engine_options)
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
 
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
@@ -16,3 +52,22 @@ Base = declarative_base()
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+def alembic_head() -> str:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cfg = Config(os.path.join(root, "alembic.ini"))
+    return ScriptDirectory.from_config(cfg).get_current_head()
+
+async def check_schema_revision(conn: AsyncConnection):
+    """Fail fast unless the database has been migrated to the Alembic head revision."""
+    head = alembic_head()
+    try:
+        current = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+    except Exception:
+        current = None
+    if current != head:
+        raise RuntimeError(
+            f"database schema is at revision {current!r}, expected {head!r}; run `alembic upgrade head`"
+        )
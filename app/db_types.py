@@ -0,0 +1,57 @@
+import uuid
+from datetime import timezone
+from sqlalchemy import BigInteger, Integer, CHAR, TIMESTAMP
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import now
+from sqlalchemy.types import TypeDecorator
+
+# SQLite only autoincrements INTEGER PRIMARY KEY, so BIGINT surrogate keys fall back to it there.
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
+
+class GUID(TypeDecorator):
+    """Native UUID on Postgres, 32-char hex elsewhere; always uuid.UUID in Python."""
+    impl = CHAR(32)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(PGUUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(32))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value if dialect.name == "postgresql" else value.hex
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(value)
+
+class UTCDateTime(TypeDecorator):
+    """
+    TIMESTAMP WITH TIME ZONE that always returns aware datetimes. Backends without a
+    zone-aware type (SQLite) store naive UTC.
+    """
+    impl = TIMESTAMP(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and dialect.name == "sqlite" and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+@compiles(now, "sqlite")
+def _sqlite_now(element, compiler, **kw):
+    # CURRENT_TIMESTAMP only has second resolution, which collapses ordering and durations.
+    # Padded to microseconds to match how SQLAlchemy stores bound datetimes, so the two
+    # compare correctly as strings.
+    return "(strftime('%Y-%m-%d %H:%M:%f', 'now') || '000')"
@@ -6,11 +6,20 @@ from app.database import get_db
 from app.models import User, Role, UserRole
 from sqlalchemy import select
 import os
+from typing import Optional
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="/auth/token")
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 
+def token_subject(token: str) -> Optional[str]:
+    """The `sub` claim of a valid access token, or None."""
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 async def get_current_user(token: str=Depends(oauth2_schema), db: AsyncSession=Depends(get_db)):
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
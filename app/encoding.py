@@ -0,0 +1,159 @@
+import gzip
+import json
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+from pydantic import TypeAdapter
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+COMPRESSION_MIN_SIZE = 1024
+
+def _default(o: Any):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, UUID):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not serializable")
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+def serialize(model, content: Any) -> Any:
+    """Validate plain rows against `model` and dump them exactly as response_model would."""
+    adapter = _adapter(model)
+    return adapter.dump_python(adapter.validate_python(content), mode="json")
+
+def encode_json(content: Any) -> bytes:
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+def _compressors():
+    # Server preference order; zstd and brotli are only offered when installed.
+    if zstandard is not None:
+        yield "zstd", lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+    if brotli is not None:
+        yield "br", lambda body: brotli.compress(body, quality=5)
+    yield "gzip", lambda body: gzip.compress(body, compresslevel=6)
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def negotiate_media_type(request: Request) -> str:
+    accept = request.headers.get("accept", "")
+    if msgpack is not None and any(m in accept for m in MSGPACK_MEDIA_TYPES):
+        return "application/msgpack"
+    return "application/json"
+
+def encoded_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    model: Any = None
+) -> Response:
+    """
+    Serialize plain Python content as JSON or MessagePack (by Accept) and compress it
+    with zstd/br/gzip (by Accept-Encoding) when it is at least COMPRESSION_MIN_SIZE bytes.
+    Pass the route's response model as `model` so the body has the same shape and value
+    formats as the routes that return models.
+    """
+    if model is not None:
+        content = serialize(model, content)
+    media_type = negotiate_media_type(request)
+    body = encode_msgpack(content) if media_type == "application/msgpack" else encode_json(content)
+
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for coding, compress in _compressors():
+            if coding in accepted:
+                body = compress(body)
+                headers["Content-Encoding"] = coding
+                break
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+async def ndjson_chunks(
+    stream: AsyncIterator[bytes],
+    chunk_size: int,
+    max_line_bytes: int
+) -> AsyncIterator[List[Tuple[int, Optional[bytes]]]]:
+    """
+    Split a streamed NDJSON body into lists of at most chunk_size (line number, line) pairs,
+    skipping blank lines. A line longer than max_line_bytes is discarded as it streams in and
+    reported as (line number, None). Only one chunk and one partial line are held at a time.
+    """
+    chunk: List[Tuple[int, Optional[bytes]]] = []
+    pending = b""
+    line_no = 0
+    skipping = False
+    async for data in stream:
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line_no += 1
+            if skipping or len(line) > max_line_bytes:
+                skipping = False
+                chunk.append((line_no, None))
+            elif line.strip():
+                chunk.append((line_no, line))
+            else:
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if skipping or len(pending) > max_line_bytes:
+            skipping = True
+            pending = b""
+    if skipping:
+        chunk.append((line_no + 1, None))
+    elif pending.strip():
+        chunk.append((line_no + 1, pending))
+    if chunk:
+        yield chunk
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streams NDJSON lines while the request body is still being read. Starlette's disconnect
+    listener would consume the request's body messages, so it is not started; a client that
+    goes away surfaces as a failed send instead.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
@@ -0,0 +1,23 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN wrapper around a SELECT that keeps its bound parameters, so a statement
+    built by crud can be explained with the same values it would run with.
+    """
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False, buffers: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+        self.buffers = buffers
+
+@compiles(Explain, "postgresql")
+def _pg_explain(element, compiler, **kw):
+    options = ["FORMAT JSON"]
+    if element.analyze:
+        options.append("ANALYZE")
+    if element.buffers:
+        options.append("BUFFERS")
+    return f"EXPLAIN ({', '.join(options)}) " + compiler.process(element.statement, **kw)
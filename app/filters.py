@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select, and_, or_, not_, bindparam, func
+from sqlalchemy.sql import Select
+from app.models import Task, User, TaskTag
+
+TASK_STATUSES = {"unassigned", "assigned", "in_progress", "review", "completed", "abandoned"}
+BOOLEAN_OPS = {"and", "or", "not"}
+COMPARISON_OPS = {"eq", "ne", "lt", "lte", "gt", "gte"}
+STATEMENT_CACHE_SIZE = 256
+
+def _parse_datetime(v: Any) -> datetime:
+    if isinstance(v, datetime):
+        return v
+    return datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+
+def _parse_status(v: Any) -> str:
+    if v not in TASK_STATUSES:
+        raise ValueError(f"invalid status '{v}'")
+    return v
+
+def _parse_value(field: str, parse, v: Any):
+    """Parse one leaf value; anything that is not a present scalar is rejected as a ValueError."""
+    if v is None or isinstance(v, (list, dict)):
+        raise ValueError(f"invalid value for field '{field}': expected a single value")
+    try:
+        return parse(v)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid value for field '{field}': {e}")
+
+def _team_of_creator(team_ids):
+    return Task.created_by.in_(select(User.id).where(User.team_id.in_(team_ids)))
+
+def _tagged(tags, match_all: bool, n=None):
+    # Driven by idx_task_tags_tag (tag, task_id): both forms are index-only range scans per tag.
+    stmt = select(TaskTag.task_id).where(TaskTag.tag.in_(tags))
+    if match_all:
+        stmt = stmt.group_by(TaskTag.task_id).having(func.count() == n)
+    return Task.id.in_(stmt)
+
+# field -> (column expression builder, value parser, allowed ops)
+FIELDS = {
+    "status": (lambda: Task.status, _parse_status, {"in", "eq", "ne"}),
+    "priority": (lambda: Task.priority, int, {"in"} | COMPARISON_OPS),
+    "assignee": (lambda: Task.current_assignee_id, lambda v: UUID(str(v)), {"in", "eq", "ne", "is_null"}),
+    "creator": (lambda: Task.created_by, lambda v: UUID(str(v)), {"in", "eq", "ne", "is_null"}),
+    "team": (None, int, {"in", "eq"}),
+    "due_date": (lambda: Task.due_date, _parse_datetime, COMPARISON_OPS | {"is_null"}),
+    "created_at": (lambda: Task.created_at, _parse_datetime, COMPARISON_OPS),
+    "title": (lambda: Task.title, str, {"contains"}),
+    "tags": (None, lambda v: str(v).strip(), {"any", "all"}),
+    "open_blockers": (lambda: Task.open_blockers, int, {"in"} | COMPARISON_OPS),
+}
+
+_statement_cache: "OrderedDict[Tuple, Select]" = OrderedDict()
+
+def _is_null_flag(node: Dict[str, Any]) -> bool:
+    value = node.get("value")
+    return True if value is None else bool(value)
+
+def structure_key(node: Dict[str, Any]) -> Tuple:
+    """Shape of a filter tree with its values stripped; equal keys compile to the same SQL."""
+    op = node.get("op")
+    if op in BOOLEAN_OPS:
+        return (op, tuple(structure_key(a) for a in node.get("args") or ()))
+    if op == "is_null":
+        # IS NULL / IS NOT NULL is structural rather than a bound value.
+        return (node.get("field"), op, _is_null_flag(node))
+    return (node.get("field"), op)
+
+def _compile(node: Dict[str, Any], params: Dict[str, Any], build: bool):
+    op = node.get("op")
+    if op in BOOLEAN_OPS:
+        args = node.get("args") or []
+        if not args:
+            raise ValueError(f"'{op}' needs at least one argument")
+        if op == "not" and len(args) != 1:
+            raise ValueError("'not' takes exactly one argument")
+        clauses = [_compile(a, params, build) for a in args]
+        if not build:
+            return None
+        if op == "not":
+            return not_(clauses[0])
+        return and_(*clauses) if op == "and" else or_(*clauses)
+
+    field = node.get("field")
+    if field not in FIELDS:
+        raise ValueError(f"unsupported filter field '{field}'")
+    column, parse, ops = FIELDS[field]
+    if op not in ops:
+        raise ValueError(f"unsupported op '{op}' for field '{field}'")
+
+    if op == "is_null":
+        if not build:
+            return None
+        col = column()
+        return col.is_(None) if _is_null_flag(node) else col.isnot(None)
+
+    name = f"p{len(params)}"
+    value = node.get("value")
+    if op in ("in", "any", "all"):
+        if not isinstance(value, list) or not value:
+            raise ValueError(f"'{op}' on '{field}' needs a non-empty list")
+        params[name] = list(dict.fromkeys(_parse_value(field, parse, v) for v in value))
+        if op == "all":
+            params[name + "_n"] = len(params[name])
+    elif op == "contains":
+        params[name] = f"%{_parse_value(field, parse, value).lower()}%"
+    else:
+        params[name] = _parse_value(field, parse, value)
+
+    if not build:
+        return None
+    if field == "tags":
+        n = bindparam(name + "_n") if op == "all" else None
+        return _tagged(bindparam(name, expanding=True), op == "all", n)
+    if field == "team":
+        param = bindparam(name, expanding=True) if op == "in" else bindparam(name)
+        return _team_of_creator(param) if op == "in" else _team_of_creator([param])
+
+    col = column()
+    if op == "in":
+        return col.in_(bindparam(name, expanding=True))
+    if op == "contains":
+        return col.ilike(bindparam(name))
+    p = bindparam(name, type_=col.type)
+    return {
+        "eq": col == p, "ne": col != p,
+        "lt": col < p, "lte": col <= p,
+        "gt": col > p, "gte": col >= p,
+    }[op]
+
+def compile_filter_clause(node: Optional[Dict[str, Any]]) -> Tuple[Optional[Any], Dict[str, Any]]:
+    """
+    Compile a filter tree into a bare WHERE clause for statements built elsewhere.
+    The clause only references Task columns and uncorrelated subqueries, so no join is needed.
+    """
+    params: Dict[str, Any] = {}
+    clause = _compile(node, params, build=True) if node else None
+    return clause, params
+
+def compile_task_filter(node: Optional[Dict[str, Any]]) -> Tuple[Select, Dict[str, Any]]:
+    """
+    Compile a nested and/or/not filter tree into a single task SELECT plus its bound values.
+    Statements are cached by tree shape, so repeated dashboard filters skip building and
+    SQLAlchemy reuses its compiled form for the identical construct.
+    """
+    params: Dict[str, Any] = {}
+    key = structure_key(node) if node else ()
+    stmt = _statement_cache.get(key)
+    if stmt is not None:
+        _statement_cache.move_to_end(key)
+        if node:
+            _compile(node, params, build=False)
+        return stmt, params
+
+    clause = _compile(node, params, build=True) if node else None
+    stmt = select(Task)
+    if clause is not None:
+        stmt = stmt.where(clause)
+    stmt = (
+        stmt.order_by(Task.created_at.desc())
+        .offset(bindparam("skip"))
+        .limit(bindparam("limit"))
+    )
+    _statement_cache[key] = stmt
+    if len(_statement_cache) > STATEMENT_CACHE_SIZE:
+        _statement_cache.popitem(last=False)
+    return stmt, params
+
+def legacy_filter_tree(
+    status: Optional[List[str]] = None,
+    priority: Optional[List[int]] = None,
+    assignee: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    title_search: Optional[str] = None,
+    tags_any: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    logic: str = "AND"
+) -> Optional[Dict[str, Any]]:
+    """Translate the flat TaskFilter criteria into a filter tree."""
+    args = []
+    if status:
+        args.append({"field": "status", "op": "in", "value": status})
+    if priority:
+        args.append({"field": "priority", "op": "in", "value": priority})
+    if assignee:
+        args.append({"field": "assignee", "op": "in", "value": assignee})
+    if start_date:
+        args.append({"field": "created_at", "op": "gte", "value": start_date})
+    if end_date:
+        args.append({"field": "created_at", "op": "lte", "value": end_date})
+    if title_search:
+        args.append({"field": "title", "op": "contains", "value": title_search})
+    if tags_any:
+        args.append({"field": "tags", "op": "any", "value": tags_any})
+    if tags_all:
+        args.append({"field": "tags", "op": "all", "value": tags_all})
+    if not args:
+        return None
+    return {"op": "or" if (logic or "AND").upper() == "OR" else "and", "args": args}
@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from starlette.responses import JSONResponse, Response
+from app.database import AsyncSessionLocal
+from app.deps import token_subject
+import app.crud as crud
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_ROUTES = {
+    ("POST", "/tasks/"),
+    ("POST", "/tasks/bulk_update"),
+    ("POST", "/assignments/"),
+    ("POST", "/comments/"),
+    ("POST", "/batch"),
+}
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# The worker running a request renews its claim every third of the lease, however long the
+# request takes; only a claim whose worker stopped renewing it can be taken over by a retry.
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_CACHE_BYTES = int(os.getenv("IDEMPOTENCY_CACHE_BYTES", str(64 * 1024 * 1024)))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+MAX_KEY_LENGTH = 255
+# Stored bodies are replayed byte for byte, so the headers that pick their media type and
+# content coding are part of what makes two requests the same.
+NEGOTIATION_HEADERS = (b"accept", b"accept-encoding")
+# Outcomes that say nothing about the request itself; a retry should run it again.
+UNSTORED_STATUSES = {401, 403, 408, 429}
+
+Headers = List[Tuple[str, str]]
+
+class StoredResponse:
+    __slots__ = ("request_hash", "status_code", "headers", "body", "expires_at")
+
+    def __init__(self, request_hash: str, status_code: int, headers: Headers, body: bytes, expires_at: datetime):
+        self.request_hash = request_hash
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """Per-process LRU of finished idempotent responses, bounded by total body size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[UUID, str], StoredResponse]" = OrderedDict()
+
+    def get(self, key: Tuple[UUID, str]) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= datetime.now(timezone.utc):
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple[UUID, str], entry: StoredResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Tuple[UUID, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for k, v in scope["headers"]:
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+def _request_user(scope) -> Optional[UUID]:
+    authorization = _header(scope, b"authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    sub = token_subject(token)
+    try:
+        return UUID(sub) if sub else None
+    except ValueError:
+        return None
+
+def _request_hash(scope, body: bytes) -> str:
+    h = hashlib.sha256()
+    h.update(scope["method"].encode())
+    h.update(b" ")
+    h.update(scope["path"].encode())
+    h.update(b"?")
+    h.update(scope.get("query_string", b""))
+    h.update(b"\n")
+    for name in NEGOTIATION_HEADERS:
+        h.update((_header(scope, name) or "").encode("latin-1"))
+        h.update(b"\n")
+    h.update(body)
+    return h.hexdigest()
+
+def _from_row(row) -> StoredResponse:
+    return StoredResponse(
+        row.request_hash,
+        row.status_code,
+        [tuple(h) for h in json.loads(row.response_headers or "[]")],
+        row.response_body or b"",
+        row.expires_at,
+    )
+
+async def _renew_claim(claim_id: int):
+    lease = timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                if not await crud.renew_idempotency_claim(db, claim_id, lease):
+                    return
+        except Exception:
+            logger.exception("renewing idempotency claim %s failed", claim_id)
+
+class IdempotencyMiddleware:
+    """
+    Replays the stored response for a repeated Idempotency-Key instead of running the request
+    again. Keys are scoped per user and kept in idempotency_keys for IDEMPOTENCY_TTL_SECONDS,
+    with a per-process LRU in front. Concurrent duplicates on this worker wait for the first
+    request and replay its response; duplicates racing on another worker get 409.
+    """
+
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+        self._in_flight: Dict[Tuple[UUID, str], asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        key = _header(scope, b"idempotency-key")
+        user_id = _request_user(scope) if key else None
+        if user_id is None:
+            # No key, or no valid token: the route runs (and rejects) as usual.
+            await self.app(scope, receive, send)
+            return
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            await JSONResponse({"detail": "Idempotency-Key must be 1-255 characters"}, status_code=400)(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        request_hash = _request_hash(scope, body)
+        cache_key = (user_id, key)
+
+        while True:
+            stored = self.cache.get(cache_key)
+            if stored is not None:
+                await self._replay(stored, request_hash, scope, receive, send)
+                return
+            pending = self._in_flight.get(cache_key)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = pending
+        try:
+            async with AsyncSessionLocal() as db:
+                claim_id, row = await crud.claim_idempotency_key(
+                    db, user_id, key, request_hash,
+                    ttl=timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+                    lease=timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+                )
+            if claim_id is None:
+                if row is None or row.status_code is None:
+                    response = JSONResponse(
+                        {"detail": "A request with this Idempotency-Key is still in progress"},
+                        status_code=409,
+                        headers={"Retry-After": "1"},
+                    )
+                    await response(scope, receive, send)
+                    return
+                stored = _from_row(row)
+                self.cache.put(cache_key, stored)
+                await self._replay(stored, request_hash, scope, receive, send)
+                return
+            await self._run(scope, receive, send, body, (user_id, key), claim_id, request_hash)
+        finally:
+            del self._in_flight[cache_key]
+            pending.set_result(None)
+
+    async def _run(self, scope, receive, send, body: bytes, cache_key: Tuple[UUID, str], claim_id: int, request_hash: str):
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code = 500
+        headers: Headers = []
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture_send(message):
+            nonlocal status_code, headers, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body" and size <= IDEMPOTENCY_MAX_BODY_BYTES:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                chunks.append(chunk)
+            await send(message)
+
+        completed = False
+        heartbeat = asyncio.create_task(_renew_claim(claim_id))
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            completed = status_code < 500 and status_code not in UNSTORED_STATUSES and size <= IDEMPOTENCY_MAX_BODY_BYTES
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            async with AsyncSessionLocal() as db:
+                if completed:
+                    response_body = b"".join(chunks)
+                    if await crud.complete_idempotency_key(db, claim_id, status_code, json.dumps(headers), response_body):
+                        expires_at = datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+                        self.cache.put(cache_key, StoredResponse(request_hash, status_code, headers, response_body, expires_at))
+                else:
+                    await crud.release_idempotency_key(db, claim_id)
+
+    async def _replay(self, stored: StoredResponse, request_hash: str, scope, receive, send):
+        if stored.request_hash != request_hash:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"},
+                status_code=422,
+            )
+        else:
+            response = Response(stored.body, status_code=stored.status_code)
+            response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored.headers]
+            response.raw_headers.append((b"idempotent-replayed", b"true"))
+        await response(scope, receive, send)
+
+idempotency_cache = ResponseCache(IDEMPOTENCY_CACHE_BYTES)
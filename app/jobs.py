@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+import app.crud as crud
+
+logger = logging.getLogger(__name__)
+
+FLOW_ROLLUP_INTERVAL_SECONDS = int(os.getenv("FLOW_ROLLUP_INTERVAL_SECONDS", "300"))
+FLOW_ROLLUP_BATCH_SIZE = 5000
+TOKEN_PURGE_INTERVAL_SECONDS = int(os.getenv("TOKEN_PURGE_INTERVAL_SECONDS", "600"))
+TOKEN_PURGE_BATCH_SIZE = 1000
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "600"))
+IDEMPOTENCY_PURGE_BATCH_SIZE = 1000
+OVERDUE_SWEEP_INTERVAL_SECONDS = int(os.getenv("OVERDUE_SWEEP_INTERVAL_SECONDS", "60"))
+
+async def rollup_task_flow(db: AsyncSession) -> int:
+    total = 0
+    while True:
+        n = await crud.rollup_task_flow(db, batch_size=FLOW_ROLLUP_BATCH_SIZE)
+        total += n
+        if n < FLOW_ROLLUP_BATCH_SIZE:
+            return total
+
+async def purge_refresh_tokens(db: AsyncSession) -> int:
+    total = 0
+    while True:
+        n = await crud.purge_refresh_tokens(db, batch_size=TOKEN_PURGE_BATCH_SIZE)
+        total += n
+        if n < TOKEN_PURGE_BATCH_SIZE:
+            return total
+
+async def purge_idempotency_keys(db: AsyncSession) -> int:
+    total = 0
+    while True:
+        n = await crud.purge_idempotency_keys(db, batch_size=IDEMPOTENCY_PURGE_BATCH_SIZE)
+        total += n
+        if n < IDEMPOTENCY_PURGE_BATCH_SIZE:
+            return total
+
+async def run_periodic(name: str, interval: int, job: Callable[[AsyncSession], Awaitable[int]]):
+    """Run `job` in a fresh session every `interval` seconds until cancelled."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                n = await job(db)
+            if n:
+                logger.info("%s processed %d rows", name, n)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s failed", name)
+        await asyncio.sleep(interval)
+
+def start_jobs() -> List[asyncio.Task]:
+    return [
+        asyncio.create_task(run_periodic("flow rollup", FLOW_ROLLUP_INTERVAL_SECONDS, rollup_task_flow)),
+        asyncio.create_task(run_periodic("refresh token purge", TOKEN_PURGE_INTERVAL_SECONDS, purge_refresh_tokens)),
+        asyncio.create_task(run_periodic("idempotency key purge", IDEMPOTENCY_PURGE_INTERVAL_SECONDS, purge_idempotency_keys)),
+        asyncio.create_task(run_periodic("overdue sweep", OVERDUE_SWEEP_INTERVAL_SECONDS, crud.sweep_overdue)),
+    ]
+
+async def stop_jobs(tasks: List[asyncio.Task]):
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
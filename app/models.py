@@ -1,59 +1,99 @@
 import uuid
 from sqlalchemy import (
     Column, String, Integer, BigInteger, Boolean, ForeignKey,
-    Text, TIMESTAMP, CheckConstraint, UniqueConstraint, Index, text
+    Text, Date, Float, Enum, LargeBinary, CheckConstraint, UniqueConstraint, Index, text, literal_column
 )
-from sqlalchemy.dialects.postgresql import UUID as PGUUID, ENUM
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.db_types import GUID, UTCDateTime, BigIntPK
 from sqlalchemy.sql import func
 
-task_status_enum = ENUM(
+# Native ENUM type on Postgres, VARCHAR with a CHECK constraint elsewhere.
+task_status_enum = Enum(
     'unassigned', 'assigned', 'in_progress', 'review', 'completed', 'abandoned',
-    name='task_status', create_type=True
+    name='task_status', create_constraint=True
 )
 
+FINISHED_TASK_STATUSES = ('completed', 'abandoned')
+# Literal form for partial indexes and the queries that must match them; bound
+# parameters would stop the planner from proving the index predicate.
+OPEN_TASK_SQL = "tasks.status NOT IN ('completed', 'abandoned')"
+OPEN_DUE_DATE_PREDICATE = "status NOT IN ('completed', 'abandoned') AND due_date IS NOT NULL"
+OPEN_STATUS_PREDICATE = "status NOT IN ('completed', 'abandoned')"
+# Text search configuration of idx_comments_body_fts; a literal, not a bound parameter, so
+# queries built with comment_tsvector match the index expression.
+COMMENT_TS_CONFIG = literal_column("'english'::regconfig")
+
+def comment_tsvector(body):
+    """The indexed comment document; comment search must use this for the planner to match the index."""
+    return func.to_tsvector(COMMENT_TS_CONFIG, body)
+
 class Team(Base):
     __tablename__ = "teams"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
 
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     username = Column(String(100), unique=True, index=True, nullable=True)
     email = Column(String(255), unique=True, index=True, nullable=True)
     team_id = Column(Integer, ForeignKey("teams.id", ondelete="SET NULL"), nullable=True)
     hashed_password = Column(Text, nullable=True)
     is_active = Column(Boolean, server_default=text('true'), nullable=False)
     is_superuser = Column(Boolean, server_default=text('false'), nullable=False)
-    last_login = Column(TIMESTAMP(timezone=True), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    last_login = Column(UTCDateTime(), nullable=True)
+    created_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
 
     team = relationship("Team", backref="users")
 
 
 class Task(Base):
     __tablename__ = "tasks"
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntPK, primary_key=True, index=True)
     title = Column(String(1000), nullable=False)
     description = Column(Text, nullable=True)
     status = Column(task_status_enum, nullable=False, server_default='unassigned')
     priority = Column(Integer, nullable=False, server_default=text('1'))
-    due_date = Column(TIMESTAMP(timezone=True), nullable=True)
-    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
-    created_by = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    due_date = Column(UTCDateTime(), nullable=True)
+    updated_at = Column(UTCDateTime(), server_default=func.now(), onupdate=func.now(), nullable=False)
+    created_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+    created_by = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     current_assignment_id = Column(BigInteger, ForeignKey("assignment.id", ondelete="SET NULL"), nullable=True)
-    deleted_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Copy of current_assignment.assigned_to, so per-user task lists need no join to assignment.
+    current_assignee_id = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    deleted_at = Column(UTCDateTime(), nullable=True)
+    # Prerequisites (task_dependencies.depends_on_task_id) not yet completed or abandoned.
+    open_blockers = Column(Integer, nullable=False, server_default=text('0'))
+    # Bumped by every edit; writers pass the version they read and lose on mismatch.
+    version = Column(Integer, nullable=False, server_default=text('1'))
 
     __table_args__ = (
         CheckConstraint('priority BETWEEN 1 AND 5', name='priority_range_check'),
         Index('idx_tasks_status', 'status'),
         Index('idx_tasks_priority', 'priority'),
         Index('idx_tasks_duedate', 'due_date'),
+        Index(
+            'idx_tasks_open_duedate', 'due_date',
+            postgresql_where=text(OPEN_DUE_DATE_PREDICATE),
+            sqlite_where=text(OPEN_DUE_DATE_PREDICATE)
+        ),
+        Index('idx_tasks_updated_at', 'updated_at'),
+        Index('idx_tasks_created_at', 'created_at'),
+        Index('idx_tasks_current_assignee', 'current_assignee_id', 'created_at'),
+        Index(
+            'idx_tasks_ready', 'open_blockers', text('priority DESC'), 'created_at',
+            postgresql_where=text(OPEN_STATUS_PREDICATE),
+            sqlite_where=text(OPEN_STATUS_PREDICATE)
+        ),
+        Index(
+            'idx_tasks_assignee_inbox', 'current_assignee_id', text('priority DESC'), 'due_date',
+            postgresql_include=['id', 'title', 'status', 'open_blockers'],
+            postgresql_where=text(OPEN_STATUS_PREDICATE),
+            sqlite_where=text(OPEN_STATUS_PREDICATE)
+        ),
     )
 
     creator = relationship("User", foreign_keys=[created_by])
@@ -66,14 +106,28 @@ class Task(Base):
         viewonly=False
     )
 
+    tag_rows = relationship("TaskTag", lazy="selectin", cascade="all, delete-orphan")
+
+    @property
+    def tags(self):
+        return [t.tag for t in self.tag_rows]
+
+    @tags.setter
+    def tags(self, values):
+        wanted = list(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+        # Keep rows for tags that stay so the flush never deletes and re-inserts the same key.
+        kept = [t for t in self.tag_rows if t.tag in wanted]
+        have = {t.tag for t in kept}
+        self.tag_rows = kept + [TaskTag(tag=v) for v in wanted if v not in have]
+
 
 class Assignment(Base):
     __tablename__ = "assignment"
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntPK, primary_key=True, index=True)
     task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
-    assigned_to = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=False)
-    assigned_by = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
-    assigned_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    assigned_to = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=False)
+    assigned_by = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    assigned_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
     delegated = Column(Boolean, server_default=text('false'), nullable=False)
     notes = Column(Text, nullable=True)
 
@@ -94,15 +148,26 @@ class Assignment(Base):
 
 class TaskComment(Base):
     __tablename__ = 'task_comments'
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntPK, primary_key=True, index=True)
     task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
-    author_id = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    author_id = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     body = Column(Text, nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
-    edited_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    created_at = Column(UTCDateTime(), nullable=False, server_default=func.now())
+    edited_at = Column(UTCDateTime(), nullable=True)
+
+    __table_args__ = (
+        Index('idx_comments_task_created', 'task_id', 'created_at', 'id'),
+        Index('idx_comments_body_fts', comment_tsvector(body), postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+
+class TaskTag(Base):
+    __tablename__ = "task_tags"
+    task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(64), primary_key=True)
 
     __table_args__ = (
-        Index('idx_comments_task', 'task_id'),
+        Index('idx_task_tags_tag', 'tag', 'task_id'),
     )
 
 
@@ -132,7 +197,7 @@ class Permission(Base):
 
 class UserRole(Base):
     __tablename__ = "user_roles"
-    user_id = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     role_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True)
 
 
@@ -144,9 +209,106 @@ class RolePermission(Base):
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
-    id = Column(BigInteger, primary_key=True)
-    user_id = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    jti = Column(PGUUID(as_uuid=True), nullable=False)
-    issued_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
-    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    id = Column(BigIntPK, primary_key=True)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    jti = Column(GUID(), nullable=False)
+    issued_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+    expires_at = Column(UTCDateTime(), nullable=False)
     revoked = Column(Boolean, nullable=False, server_default=text('false'))
+
+    __table_args__ = (
+        Index('idx_refresh_tokens_jti', 'jti', unique=True),
+        Index('idx_refresh_tokens_expires', 'expires_at'),
+        Index('idx_refresh_tokens_revoked', 'id', postgresql_where=text('revoked'), sqlite_where=text('revoked')),
+    )
+
+
+class TaskStatusTransition(Base):
+    __tablename__ = "task_status_transitions"
+    id = Column(BigIntPK, primary_key=True)
+    task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
+    from_status = Column(task_status_enum, nullable=True)
+    to_status = Column(task_status_enum, nullable=False)
+    assignee_id = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    transitioned_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_status_transitions_task', 'task_id', 'transitioned_at'),
+    )
+
+
+class TaskFlowDaily(Base):
+    __tablename__ = "task_flow_daily"
+    scope = Column(String(10), primary_key=True)
+    scope_id = Column(String(64), primary_key=True)
+    day = Column(Date, primary_key=True)
+    created_count = Column(Integer, nullable=False, server_default=text('0'))
+    started_count = Column(Integer, nullable=False, server_default=text('0'))
+    completed_count = Column(Integer, nullable=False, server_default=text('0'))
+    lead_time_seconds = Column(Float, nullable=False, server_default=text('0'))
+    cycle_time_seconds = Column(Float, nullable=False, server_default=text('0'))
+    cycle_time_samples = Column(Integer, nullable=False, server_default=text('0'))
+
+
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+    name = Column(String(100), primary_key=True)
+    last_id = Column(BigInteger, nullable=False, server_default=text('0'))
+    last_at = Column(UTCDateTime(), nullable=True)
+    updated_at = Column(UTCDateTime(), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class OverdueTask(Base):
+    __tablename__ = "overdue_tasks"
+    task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    due_date = Column(UTCDateTime(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_overdue_tasks_user', 'user_id', 'due_date'),
+    )
+
+
+class UserOverdue(Base):
+    __tablename__ = "user_overdue"
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    overdue_count = Column(Integer, nullable=False, server_default=text('0'))
+    updated_at = Column(UTCDateTime(), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_user_overdue_count', 'overdue_count'),
+    )
+
+
+class OverdueEvent(Base):
+    __tablename__ = "overdue_events"
+    id = Column(BigIntPK, primary_key=True)
+    task_id = Column(BigInteger, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    event = Column(String(20), nullable=False)
+    occurred_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_overdue_events_task', 'task_id', 'occurred_at'),
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    id = Column(BigIntPK, primary_key=True)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    # NULL until the first request with this key has finished.
+    status_code = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+    # Lease of an unfinished claim, renewed by the worker running the request.
+    locked_until = Column(UTCDateTime(), server_default=func.now(), nullable=False)
+    expires_at = Column(UTCDateTime(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_idempotency_keys_user_key', 'user_id', 'key', unique=True),
+        Index('idx_idempotency_keys_expires', 'expires_at'),
+    )
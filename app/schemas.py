@@ -1,8 +1,12 @@
 from __future__ import annotations
-from typing import Optional, List
-from pydantic import BaseModel, Field, EmailStr
+from typing import Optional, List, Any, Dict, Literal, Annotated
+from pydantic import BaseModel, Field, EmailStr, StringConstraints
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, date
+
+# task_tags.tag is VARCHAR(64).
+Tag = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=64)]
+MAX_TAGS_PER_TASK = 50
 
 class BaseReadModel(BaseModel):
     model_config = {"from_attributes": True}
@@ -21,6 +25,29 @@ class UserCreate(BaseModel):
     team_id: Optional[int] = None
     password: str
 
+class UserProvisionItem(BaseModel):
+    username: str
+    email: EmailStr
+    password: str
+    team: Optional[str] = None
+
+class UserProvisionRequest(BaseModel):
+    users: List[UserProvisionItem] = Field(..., min_length=1, max_length=10000)
+    create_missing_teams: bool = False
+
+class UserProvisionResult(BaseModel):
+    index: int
+    username: str
+    ok: bool
+    id: Optional[UUID] = None
+    team_id: Optional[int] = None
+    error: Optional[str] = None
+
+class UserProvisionResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[UserProvisionResult]
+
 class UserRead(BaseReadModel):
     id: UUID
     username: Optional[str] = None
@@ -37,6 +64,7 @@ class TaskCreate(BaseModel):
     priority: Optional[int] = Field(1, ge=1, le=5)
     due_date: Optional[datetime] = None
     created_by: Optional[UUID] = None
+    tags: Optional[List[Tag]] = Field(None, max_length=MAX_TAGS_PER_TASK)
 
 class TaskRead(BaseReadModel):
     id: int
@@ -48,6 +76,18 @@ class TaskRead(BaseReadModel):
     updated_at: datetime
     created_at: datetime
     created_by: Optional[UUID] = None
+    tags: List[str] = []
+    open_blockers: int = 0
+    comment_count: int = 0
+    version: int = 1
+
+class InboxTask(BaseModel):
+    id: int
+    title: str
+    status: str
+    priority: int
+    due_date: Optional[datetime] = None
+    open_blockers: int
 
 class AssignmentCreate(BaseModel):
     task_id: int
@@ -55,6 +95,7 @@ class AssignmentCreate(BaseModel):
     assigned_by: Optional[UUID] = None
     delegated: Optional[bool] = False
     notes: Optional[str] = None
+    expected_version: Optional[int] = None
 
 class AssignmentRead(BaseReadModel):
     id: int
@@ -78,6 +119,10 @@ class CommentRead(BaseReadModel):
     created_at: datetime
     edited_at: Optional[datetime] = None
 
+class CommentPage(BaseModel):
+    items: List[CommentRead]
+    next_cursor: Optional[str] = None
+
 class DependencyCreate(BaseModel):
     task_id: int
     depends_on_task_id: int
@@ -134,6 +179,17 @@ class BulkTaskUpdateItem(BaseModel):
     due_date: Optional[datetime] = None
     current_assignment_id: Optional[int] = None
     deleted_at: Optional[datetime] = None
+    tags: Optional[List[Tag]] = Field(None, max_length=MAX_TAGS_PER_TASK)
+    expected_version: Optional[int] = None
+
+class TaskUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    priority: Optional[int] = Field(None, ge=1, le=5)
+    due_date: Optional[datetime] = None
+    tags: Optional[List[Tag]] = Field(None, max_length=MAX_TAGS_PER_TASK)
+    expected_version: Optional[int] = None
 
 class BulkTaskUpdateRequest(BaseModel):
     items: List[BulkTaskUpdateItem]
@@ -142,12 +198,51 @@ class BulkTaskUpdateResultItem(BaseModel):
     id: int
     ok: bool
     error: Optional[str] = None
+    version: Optional[int] = None
+    conflict: bool = False
 
 class BulkTaskUpdateResponse(BaseModel):
     updated: List[int]
     not_found: List[int]
+    conflicts: List[int] = []
     results: List[BulkTaskUpdateResultItem]
 
+class BatchOperation(BaseModel):
+    """
+    One step of POST /batch. `args` takes the body of the matching single endpoint;
+    id fields may be "$<ref>" or "$<ref>.<field>" to use an earlier step's result.
+    """
+    op: Literal["create_task", "update_task", "assign", "add_comment", "add_dependency"]
+    ref: Optional[str] = Field(None, pattern=r"^[A-Za-z_][\w-]*$")
+    args: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=100)
+
+class BatchResultItem(BaseModel):
+    index: int
+    op: str
+    ref: Optional[str] = None
+    ok: bool
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    committed: bool
+    results: List[BatchResultItem]
+
+class FilterExpr(BaseModel):
+    """
+    Node of a nested task filter. Boolean nodes use op and/or/not with `args`;
+    leaves name a `field` (status, priority, assignee, creator, team, due_date,
+    created_at, title, tags, open_blockers) with op in/eq/ne/lt/lte/gt/gte/is_null/contains
+    (any/all for tags) and a `value`.
+    """
+    op: str
+    args: Optional[List[FilterExpr]] = None
+    field: Optional[str] = None
+    value: Optional[Any] = None
+
 class TaskFilter(BaseModel):
     status: Optional[List[str]] = None
     priority: Optional[List[int]] = None
@@ -155,7 +250,10 @@ class TaskFilter(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     title_search: Optional[str] = None
+    tags_any: Optional[List[str]] = None
+    tags_all: Optional[List[str]] = None
     logic: Optional[str] = "AND"
+    where: Optional[FilterExpr] = None
     skip: int = 0
     limit: int = 50
 
@@ -163,6 +261,23 @@ class DistributionItem(BaseModel):
     key: Optional[str]  
     count: int
 
+class DistributionCubeRequest(BaseModel):
+    group_by: List[str]
+    mode: str = "sets"
+    where: Optional[FilterExpr] = None
+
+class DistributionCubeItem(BaseModel):
+    keys: dict[str, Optional[str]]
+    count: int
+
+class DistributionCubeGrouping(BaseModel):
+    dimensions: List[str]
+    items: List[DistributionCubeItem]
+
+class DistributionCubeResponse(BaseModel):
+    total: int
+    groupings: List[DistributionCubeGrouping]
+
 class TaskBrief(BaseModel):
     id: int
     title: str
@@ -184,3 +299,17 @@ class TaskDistributionResponse(BaseModel):
 class OverdueByUserResponse(BaseModel):
     as_of: datetime
     users: List[OverdueUserItem]
+
+class FlowMetricsItem(BaseModel):
+    scope_id: Optional[str]
+    period_start: date
+    created: int
+    started: int
+    completed: int
+    avg_lead_time_seconds: Optional[float] = None
+    avg_cycle_time_seconds: Optional[float] = None
+
+class FlowMetricsResponse(BaseModel):
+    scope: str
+    bucket: str
+    items: List[FlowMetricsItem]
@@ -0,0 +1,273 @@
+"""
+Query-plan regression check for the crud hot paths (Postgres only).
+
+Seeds a scratch database with a deterministic dataset, runs each crud call below
+inside a rolled-back transaction while capturing every statement it sends, and
+re-runs those statements under EXPLAIN (ANALYZE, BUFFERS), again rolled back, so
+every case sees the same seeded data. A case fails when a plan sequentially scans
+a table that is not small or not allowed for that case, when it issues a
+different number of statements than the recorded baseline, or when its shared
+buffers exceed the baseline by more than BUFFER_TOLERANCE. Exits non-zero on
+failure:
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... uv run python -m benchmarks.query_plans
+    BENCH_DATABASE_URL=postgresql+asyncpg://... uv run python -m benchmarks.query_plans --record
+
+Seeding drops every application table, so the check only runs against
+BENCH_DATABASE_URL, or against DATABASE_URL when --allow-destroy is passed.
+--record rewrites benchmarks/query_plan_baseline.json after an intended change.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+if BENCH_DATABASE_URL:
+    # app.database builds its engine from DATABASE_URL at import time.
+    os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import engine, Base, AsyncSessionLocal
+from app.models import Team, User, Task, Assignment, TaskTag, TaskDependency, TaskComment
+import app.crud as crud
+
+BASELINE_PATH = Path(__file__).with_name("query_plan_baseline.json")
+DEFAULT_SCALE = 20_000
+BUFFER_TOLERANCE = 1.25
+# Absolute slack so plans touching a handful of pages do not fail on noise.
+BUFFER_SLACK = 16
+# Sequential scans of tables up to this many pages are cheaper than any index and are ignored.
+SMALL_TABLE_PAGES = 16
+SEED_CHUNK = 5_000
+STATUSES = ["unassigned", "assigned", "in_progress", "review", "completed", "abandoned"]
+STATUS_WEIGHTS = [10, 15, 15, 5, 45, 10]
+TAGS = [f"tag-{i}" for i in range(30)]
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+async def _insert_chunked(db, model, rows):
+    for start in range(0, len(rows), SEED_CHUNK):
+        await db.execute(insert(model), rows[start:start + SEED_CHUNK])
+
+async def seed(scale: int) -> dict:
+    rng = random.Random(42)
+    n_users = max(scale // 10, 100)
+    async with engine.begin() as conn:
+        # Recreated rather than truncated so the indexes always match models.py.
+        tables = ", ".join(Base.metadata.tables)
+        await conn.execute(text(f"DROP TABLE IF EXISTS {tables} CASCADE"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        await _insert_chunked(db, Team, [{"name": f"team-{i}"} for i in range(50)])
+        user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(n_users)]
+        await _insert_chunked(db, User, [
+            {"id": uid, "username": f"user-{i}", "email": f"user-{i}@example.com", "team_id": i % 50 + 1}
+            for i, uid in enumerate(user_ids)
+        ])
+        await _insert_chunked(db, Task, [
+            {
+                "title": f"Task {i} {rng.choice(['deploy', 'review', 'migrate', 'fix', 'document'])}",
+                "status": rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+                "priority": rng.randint(1, 5),
+                "due_date": NOW + timedelta(days=rng.randint(-60, 60)) if rng.random() < 0.7 else None,
+                "created_at": NOW - timedelta(minutes=scale - i),
+                "created_by": rng.choice(user_ids),
+            }
+            for i in range(scale)
+        ])
+        await _insert_chunked(db, Assignment, [
+            {"task_id": t, "assigned_to": rng.choice(user_ids), "assigned_at": NOW}
+            for t in range(1, scale + 1) if rng.random() < 0.7
+        ])
+        await _insert_chunked(db, TaskTag, [
+            {"task_id": t, "tag": tag}
+            for t in range(1, scale + 1)
+            for tag in rng.sample(TAGS, rng.randint(0, 3))
+        ])
+        await _insert_chunked(db, TaskDependency, [
+            {"task_id": t, "depends_on_task_id": rng.randint(1, t - 1)}
+            for t in range(2, scale + 1) if rng.random() < 0.1
+        ])
+        await _insert_chunked(db, TaskComment, [
+            {"task_id": rng.randint(1, scale), "body": f"{rng.choice(['deploy', 'blocked', 'looks good', 'retry'])} {i}"}
+            for i in range(scale)
+        ])
+        await db.execute(text(
+            "UPDATE tasks SET current_assignment_id = a.id, current_assignee_id = a.assigned_to "
+            "FROM assignment a WHERE a.task_id = tasks.id"
+        ))
+        await db.execute(text(
+            "UPDATE tasks SET open_blockers = b.n FROM ("
+            " SELECT d.task_id, count(*) AS n FROM task_dependencies d"
+            " JOIN tasks p ON p.id = d.depends_on_task_id"
+            " WHERE p.status NOT IN ('completed', 'abandoned') GROUP BY d.task_id"
+            ") b WHERE tasks.id = b.task_id"
+        ))
+        await db.commit()
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE"))
+    return {"user_id": user_ids[0], "team_id": 1, "scale": scale}
+
+def cases(ctx: dict) -> list:
+    """(name, crud call, tables it may scan sequentially); write paths pass commit=False."""
+    uid = ctx["user_id"]
+    recent = (NOW - timedelta(days=3)).isoformat()
+    as_of = NOW
+    ids = list(range(1, ctx["scale"] + 1, ctx["scale"] // 50))
+    return [
+        ("filter_tasks.status", lambda db: crud.filter_tasks(db, status=["in_progress", "review"]), set()),
+        ("filter_tasks.priority", lambda db: crud.filter_tasks(db, priority=[5]), set()),
+        ("filter_tasks.assignee", lambda db: crud.filter_tasks(db, assignee=[str(uid)]), set()),
+        ("filter_tasks.created_range", lambda db: crud.filter_tasks(db, start_date=recent), set()),
+        ("filter_tasks.tags_any", lambda db: crud.filter_tasks(db, tags_any=["tag-3"]), set()),
+        ("filter_tasks.tags_all", lambda db: crud.filter_tasks(db, tags_all=["tag-3", "tag-7"]), set()),
+        ("filter_tasks.team", lambda db: crud.filter_tasks(db, where={"field": "team", "op": "eq", "value": ctx["team_id"]}), set()),
+        ("filter_tasks.due_soon", lambda db: crud.filter_tasks(db, where={"op": "and", "args": [
+            {"field": "due_date", "op": "lt", "value": (NOW + timedelta(days=2)).isoformat()},
+            {"field": "due_date", "op": "gte", "value": NOW.isoformat()},
+        ]}), set()),
+        # ILIKE '%...%' cannot use a b-tree; bounded by the LIMIT and watched through buffers.
+        ("filter_tasks.title", lambda db: crud.filter_tasks(db, title_search="deploy"), {"tasks"}),
+        # Whole-table aggregates read every row by design; buffers are the regression signal.
+        ("get_task_distribution.status", lambda db: crud.get_task_distribution(db, "status"), {"tasks"}),
+        ("get_task_distribution.priority", lambda db: crud.get_task_distribution(db, "priority"), {"tasks"}),
+        ("get_task_distribution.team", lambda db: crud.get_task_distribution(db, "team"), {"tasks", "users"}),
+        ("get_task_distribution.assignee", lambda db: crud.get_task_distribution(db, "assignee"), {"tasks", "assignment", "users"}),
+        ("get_task_distribution.tag", lambda db: crud.get_task_distribution(db, "tag"), {"task_tags"}),
+        # Ranks every user with overdue work, so all users are hashed for the join.
+        ("get_overdue_tasks_per_user", lambda db: crud.get_overdue_tasks_per_user(db, as_of=as_of), {"users"}),
+        ("get_overdue_tasks_per_user.include_tasks", lambda db: crud.get_overdue_tasks_per_user(db, as_of=as_of, include_tasks=True), {"users"}),
+        ("bulk_update_tasks", lambda db: crud.bulk_update_tasks(db, [
+            {"id": i, "status": "completed", "priority": 3} for i in ids
+        ], commit=False), set()),
+        ("list_ready_tasks", lambda db: crud.list_ready_tasks(db), set()),
+        ("list_user_inbox", lambda db: crud.list_user_inbox(db, uid), set()),
+        ("list_task_comments", lambda db: crud.list_task_comments(db, ids[1]), set()),
+        ("search_comments", lambda db: crud.search_comments(db, "blocked"), set()),
+    ]
+
+async def capture(call) -> list:
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "INSERT", "DELETE"):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        async with engine.connect() as conn:
+            trans = await conn.begin()
+            # A commit inside the call only releases a savepoint; the outer rollback undoes
+            # the case's writes so the next case runs against the seeded data.
+            db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+            try:
+                await call(db)
+            finally:
+                await db.close()
+                await trans.rollback()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _record)
+    return statements
+
+async def explain(statement: str, parameters) -> dict:
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            result = await conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+            plan = result.scalar()
+        finally:
+            await trans.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+def seq_scans(node: dict):
+    if node.get("Node Type") == "Seq Scan":
+        yield node["Relation Name"]
+    for child in node.get("Plans", ()):
+        yield from seq_scans(child)
+
+async def table_pages() -> dict:
+    async with engine.connect() as conn:
+        q = await conn.execute(text(
+            "SELECT relname, relpages FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = current_schema() AND c.relkind = 'r'"
+        ))
+        return dict(q.all())
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="write the measured buffers as the new baseline")
+    parser.add_argument("--scale", type=int, default=DEFAULT_SCALE, help="number of seeded tasks")
+    parser.add_argument("--allow-destroy", action="store_true", help="seed DATABASE_URL when BENCH_DATABASE_URL is unset")
+    args = parser.parse_args()
+
+    if not BENCH_DATABASE_URL and not args.allow_destroy:
+        sys.exit(
+            "query plan checks drop and recreate every table; set BENCH_DATABASE_URL to a scratch "
+            "database, or pass --allow-destroy to wipe DATABASE_URL"
+        )
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("query plan checks need Postgres")
+
+    ctx = await seed(args.scale)
+    pages = await table_pages()
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    compare = not args.record and baseline.get("scale") == args.scale
+    if not args.record and not compare:
+        print(f"no baseline for scale {args.scale}; checking scans only")
+
+    measured = {}
+    failures = []
+    print(f"{'case':<44} {'stmt':>4} {'buffers':>8} {'baseline':>8}  result")
+    for name, call, allowed in cases(ctx):
+        buffers = []
+        recorded = baseline["cases"].get(name, []) if compare else []
+        for i, (statement, parameters) in enumerate(await capture(call)):
+            plan = await explain(statement, parameters)
+            used = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+            buffers.append(used)
+            problems = [
+                f"seq scan on {rel}" for rel in dict.fromkeys(seq_scans(plan))
+                if rel not in allowed and pages.get(rel, 0) > SMALL_TABLE_PAGES
+            ]
+            expected = None
+            if compare:
+                if i >= len(recorded):
+                    problems.append("statement not in baseline")
+                else:
+                    expected = recorded[i]
+                    if used > expected * BUFFER_TOLERANCE + BUFFER_SLACK:
+                        problems.append(f"buffers {used} > baseline {expected}")
+            if problems:
+                failures.append((name, i, statement, problems))
+            shown = "-" if expected is None else expected
+            print(f"{name:<44} {i:>4} {used:>8} {shown:>8}  {'; '.join(problems) or 'ok'}")
+        if compare and len(buffers) != len(recorded):
+            problem = f"{len(buffers)} statements, baseline has {len(recorded)}"
+            failures.append((name, len(buffers), "", [problem]))
+            print(f"{name:<44} {'':>4} {'':>8} {'':>8}  {problem}")
+        measured[name] = buffers
+
+    await engine.dispose()
+    if args.record:
+        BASELINE_PATH.write_text(json.dumps({"scale": args.scale, "cases": measured}, indent=2) + "\n")
+        print(f"baseline written to {BASELINE_PATH}")
+    if failures:
+        print(f"\n{len(failures)} plan regression(s):")
+        for name, i, statement, problems in failures:
+            print(f"- {name} #{i}: {'; '.join(problems)}\n    {' '.join(statement.split())[:300]}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Refresh-token latency as the refresh_tokens table grows.
+
+Seeds the table in steps and times POST /auth/token/refresh's database work
+(crud.rotate_refresh_token) at each size. Run against a scratch database:
+
+    DATABASE_URL=postgresql+asyncpg://... uv run python -m benchmarks.refresh_latency
+"""
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select
+from app.database import engine, Base, AsyncSessionLocal
+from app.models import User, RefreshToken
+import app.crud as crud
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SAMPLES = 200
+SEED_CHUNK = 10_000
+
+async def seed(user_id, n: int):
+    expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+    async with AsyncSessionLocal() as db:
+        for start in range(0, n, SEED_CHUNK):
+            rows = [
+                {"user_id": user_id, "jti": uuid.uuid4(), "expires_at": expires_at}
+                for _ in range(min(SEED_CHUNK, n - start))
+            ]
+            await db.execute(insert(RefreshToken), rows)
+        await db.commit()
+
+async def measure() -> list:
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(RefreshToken.jti).where(RefreshToken.revoked.is_(False)).limit(SAMPLES))
+        jtis = q.scalars().all()
+    timings = []
+    expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+    async with AsyncSessionLocal() as db:
+        for jti in jtis:
+            t0 = time.perf_counter()
+            await crud.rotate_refresh_token(db, jti=jti, new_jti=uuid.uuid4(), expires_at=expires_at)
+            timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username=f"bench-{uuid.uuid4().hex[:8]}")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    seeded = 0
+    print(f"{'rows':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for size in SIZES:
+        await seed(user_id, size - seeded)
+        seeded = size
+        timings = sorted(await measure())
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>10} {statistics.median(timings):>8.2f} {p95:>8.2f} {timings[-1]:>8.2f}")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
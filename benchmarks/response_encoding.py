@@ -0,0 +1,82 @@
+"""
+Serialization cost and wire size of a large task listing.
+
+Builds synthetic task rows (no database needed) and compares per-row pydantic
+models with the single TypeAdapter pass over row dicts used by app.encoding, then
+reports body sizes for each content coding the installed extras support:
+
+    uv run --extra encodings python -m benchmarks.response_encoding
+"""
+import gzip
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import app.schemas as schemas
+from app.encoding import brotli, zstandard, msgpack, encode_json, encode_msgpack, serialize
+
+ROWS = [1_000, 10_000]
+REPEAT = 5
+STATUSES = ["unassigned", "assigned", "in_progress", "review", "completed", "abandoned"]
+TAGS = ["backend", "frontend", "infra", "bug", "feature", "docs"]
+
+def make_rows(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    users = [uuid.uuid4() for _ in range(50)]
+    return [
+        {
+            "id": i,
+            "title": f"Task {i}: follow up on ticket",
+            "description": "Investigate and report back." if i % 3 else None,
+            "status": random.choice(STATUSES),
+            "priority": random.randint(1, 5),
+            "due_date": now + timedelta(days=random.randint(-30, 30)) if i % 4 else None,
+            "updated_at": now,
+            "created_at": now - timedelta(days=random.randint(0, 365)),
+            "created_by": random.choice(users),
+            "tags": random.sample(TAGS, random.randint(0, 2)),
+        }
+        for i in range(n)
+    ]
+
+def pydantic_json(rows: list) -> bytes:
+    payload = [schemas.TaskRead.model_validate(r).model_dump(mode="json") for r in rows]
+    return json.dumps(payload).encode("utf-8")
+
+def adapter_json(rows: list) -> bytes:
+    return encode_json(serialize(list[schemas.TaskRead], rows))
+
+def timed(fn, *args) -> tuple:
+    timings = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), out
+
+def main():
+    codings = [("gzip", lambda b: gzip.compress(b, compresslevel=6))]
+    if brotli is not None:
+        codings.append(("br", lambda b: brotli.compress(b, quality=5)))
+    if zstandard is not None:
+        codings.append(("zstd", lambda b: zstandard.ZstdCompressor(level=3).compress(b)))
+
+    for n in ROWS:
+        rows = make_rows(n)
+        print(f"\n{n} rows")
+        print(f"{'encoding':<24} {'ms':>8} {'bytes':>10}")
+        ms, body = timed(pydantic_json, rows)
+        print(f"{'pydantic json':<24} {ms:>8.1f} {len(body):>10}")
+        ms, body = timed(adapter_json, rows)
+        print(f"{'adapter json':<24} {ms:>8.1f} {len(body):>10}")
+        for name, compress in codings:
+            c_ms, compressed = timed(compress, body)
+            print(f"{'adapter json + ' + name:<24} {ms + c_ms:>8.1f} {len(compressed):>10}")
+        if msgpack is not None:
+            ms, packed = timed(lambda r: encode_msgpack(serialize(list[schemas.TaskRead], r)), rows)
+            print(f"{'adapter msgpack':<24} {ms:>8.1f} {len(packed):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,30 @@
+import os
 import uvicorn
 from dotenv import load_dotenv
 load_dotenv()
 
-if __name__ == "__main__":
+def run_development():
     uvicorn.run(app="app.app:app", host="0.0.0.0", port=8000, reload=True)
-    
\ No newline at end of file
+
+def run_production():
+    # Each worker is a separate process with its own DB pool (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+    # so size WEB_CONCURRENCY against the database's max_connections.
+    uvicorn.run(
+        app="app.app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        loop="uvloop",
+        http="httptools",
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        proxy_headers=True,
+        access_log=os.getenv("ACCESS_LOG", "false").lower() == "true",
+    )
+
+if __name__ == "__main__":
+    if os.getenv("APP_ENV", "development") == "production":
+        run_production()
+    else:
+        run_development()